@@ -0,0 +1,53 @@
+import pytest
+
+from py_pipeline.config import get_settings
+from py_pipeline.load import get_pipeline
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--tickers",
+        default="10,500",
+        help="Comma separated numbers of tickers to benchmark, e.g. 10,500,5000",
+    )
+    parser.addoption(
+        "--years",
+        default="1,5",
+        help="Comma separated numbers of years of daily prices to benchmark",
+    )
+    parser.addoption(
+        "--data-path",
+        default=None,
+        help="Data lake for the load benchmarks, e.g. s3://bucket. Defaults to a "
+        "temporary directory",
+    )
+    parser.addoption(
+        "--dw",
+        action="store_true",
+        help="Run the data warehouse load benchmarks against the Postgres database "
+        "set by the DB_* environment variables",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    for fixture, option in (("n_tickers", "--tickers"), ("n_years", "--years")):
+        if fixture in metafunc.fixturenames:
+            values = [
+                int(value) for value in metafunc.config.getoption(option).split(",")
+            ]
+            metafunc.parametrize(fixture, values, ids=lambda v, f=fixture: f"{f}={v}")
+
+
+@pytest.fixture
+def data_path(request, monkeypatch, tmp_path):
+    data_path = request.config.getoption("--data-path") or str(tmp_path)
+    monkeypatch.setenv("DATA_PATH", data_path)
+    get_pipeline.cache_clear()
+    yield get_settings().data_path
+    get_pipeline.cache_clear()
+
+
+@pytest.fixture
+def dw(request):
+    if not request.config.getoption("--dw"):
+        pytest.skip("needs --dw and a Postgres database")
@@ -0,0 +1,46 @@
+import itertools
+
+import pytest
+from deltalake import DeltaTable, write_deltalake
+
+from benchmarks.synthetic import make_wide_prices_for_years
+from py_pipeline.load import load_to_s3
+from py_pipeline.transform import transform_price_df
+
+
+@pytest.fixture
+def long_prices(n_tickers, n_years):
+    wide_prices = make_wide_prices_for_years(n_tickers, n_years)
+    return transform_price_df(wide_prices, "sp_stocks", "skip")
+
+
+def test_write_price_history(benchmark, tmp_path, long_prices):
+    # Each round writes a new table, so appends don't grow the table being timed
+    paths = (tmp_path.joinpath(f"price_history_{i}") for i in itertools.count())
+
+    def setup():
+        return (str(next(paths)), long_prices), {}
+
+    benchmark.pedantic(write_deltalake, setup=setup, rounds=5)
+
+
+def test_read_price_history_window(benchmark, tmp_path, long_prices):
+    path = str(tmp_path.joinpath("price_history"))
+    write_deltalake(path, long_prices)
+    start, end = long_prices["date_stamp"].iloc[[-1000, -1]]
+
+    def read_window():
+        return DeltaTable(path).to_pyarrow_table(
+            filters=[("date_stamp", ">=", start), ("date_stamp", "<=", end)]
+        )
+
+    table = benchmark(read_window)
+
+    assert table.num_rows >= 1000
+
+
+def test_load_price_history(benchmark, data_path, long_prices):
+    # Later rounds merge into the table written by the first one
+    benchmark.pedantic(
+        load_to_s3, args=(long_prices, "price_history", "sp_stocks", "skip"), rounds=3
+    )
@@ -0,0 +1,51 @@
+import pytest
+
+from benchmarks.delta_test import long_prices  # noqa: F401
+from py_pipeline.load import load_to_dw
+from py_pipeline.postgres import get_postgres_pool
+
+TABLE_NAME = "price_history_sp_stocks"
+
+
+def drop_price_history():
+    pool = get_postgres_pool()
+    connection = pool.getconn()
+    try:
+        with connection, connection.cursor() as cursor:
+            # dlt recreates the tables it loaded before only when its state is dropped
+            for table in [
+                TABLE_NAME,
+                "_dlt_loads",
+                "_dlt_pipeline_state",
+                "_dlt_version",
+            ]:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    finally:
+        pool.putconn(connection)
+
+
+@pytest.fixture
+def empty_dw(dw):
+    drop_price_history()
+    yield
+    drop_price_history()
+
+
+@pytest.mark.parametrize("loader", ("dlt", "copy"))
+def test_load_price_history_to_dw(benchmark, empty_dw, long_prices, loader):
+    # Each round loads the full history into an empty table
+    def setup():
+        drop_price_history()
+        return (long_prices, "price_history", "sp_stocks", loader), {}
+
+    benchmark.pedantic(load_to_dw, setup=setup, rounds=3)
+
+
+@pytest.mark.parametrize("loader", ("dlt", "copy"))
+def test_merge_price_history_into_dw(benchmark, empty_dw, long_prices, loader):
+    # Later rounds merge the full history into the table loaded by the first one
+    load_to_dw(long_prices, "price_history", "sp_stocks", loader)
+
+    benchmark.pedantic(
+        load_to_dw, args=(long_prices, "price_history", "sp_stocks", loader), rounds=3
+    )
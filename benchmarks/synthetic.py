@@ -0,0 +1,74 @@
+"""Synthetic source data shaped like the yfinance and Wikipedia extracts."""
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+def make_wide_prices(
+    n_tickers: int, n_days: int, seed: int = 0, missing_tickers: int = 0
+) -> pd.DataFrame:
+    """
+    Create wide daily prices shaped like a yfinance download.
+
+    The last `missing_tickers` tickers have no data, like symbols that failed to
+    download.
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2000-01-03", periods=n_days, tz="UTC", name="Date")
+    tickers = [f"T{i:04d}" for i in range(n_tickers)]
+
+    close = 100 * np.exp(rng.normal(0, 0.01, (n_days, n_tickers)).cumsum(axis=0))
+    volume = rng.integers(1_000, 10_000_000, (n_days, n_tickers)).astype("float64")
+    frames = {
+        "Close": close,
+        "High": close * 1.01,
+        "Low": close * 0.99,
+        "Open": close * (1 + rng.normal(0, 0.005, (n_days, n_tickers))),
+        "Volume": volume,
+    }
+    for values in frames.values():
+        values[:, n_tickers - missing_tickers :] = np.nan
+
+    return pd.concat(
+        {
+            price: pd.DataFrame(values, index, tickers)
+            for price, values in frames.items()
+        },
+        axis=1,
+        names=["Price", "Ticker"],
+    )
+
+
+def make_wide_prices_for_years(
+    n_tickers: int, n_years: int, seed: int = 0
+) -> pd.DataFrame:
+    return make_wide_prices(n_tickers, n_years * TRADING_DAYS_PER_YEAR, seed)
+
+
+def make_stock_symbols(n_symbols: int, seed: int = 0) -> pd.DataFrame:
+    """Create S&P constituents shaped like the concatenated Wikipedia tables."""
+    rng = np.random.default_rng(seed)
+    sectors = np.array([f"Sector {i}" for i in range(11)], dtype=object)
+    industries = np.array([f"Industry {i}" for i in range(120)], dtype=object)
+
+    symbols = pd.DataFrame(
+        {
+            "Symbol": [
+                f"T{i:04d}" if i % 50 else f"T{i:03d}.B" for i in range(n_symbols)
+            ],
+            "Security": [f"Company {i}" for i in range(n_symbols)],
+            "GICS Sector": rng.choice(sectors, n_symbols),
+            "GICS Sub-Industry": rng.choice(industries, n_symbols),
+            "Headquarters Location": "New York City, New York",
+            "SEC filings": "reports",
+            "Date added": "2000-01-01",
+            "CIK": rng.integers(1_000, 2_000_000, n_symbols),
+            "Founded": "1900",
+        }
+    )
+    index_membership = rng.integers(0, 3, n_symbols)
+    for i, column in enumerate(("in_sp400", "in_sp500", "in_sp600")):
+        symbols[column] = np.where(index_membership == i, True, None)
+    return symbols
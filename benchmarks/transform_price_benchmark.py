@@ -0,0 +1,53 @@
+"""
+Compare transform_price_df with the stack based implementation it replaced.
+
+Usage: python -m benchmarks.transform_price_benchmark [n_tickers] [n_days]
+"""
+
+import sys
+import timeit
+
+import pandas as pd
+
+from benchmarks.synthetic import make_wide_prices
+from py_pipeline.transform import get_price_symbols, transform_price_df
+from py_pipeline.validate import raw_price_schema
+
+
+def stack_transform_price_df(df: pd.DataFrame, asset_category: str) -> pd.DataFrame:
+    """The previous implementation, reshaping with DataFrame.stack."""
+    if df.empty:
+        return df
+
+    df = raw_price_schema.validate(df, lazy=True)
+    cols_without_data = df.columns[df.isna().sum() == df.shape[0]]
+
+    df = df.drop(cols_without_data, axis=1)
+    df = df.stack("Ticker", future_stack=True).reset_index()
+    df.columns = df.columns.str.lower().rename(None)
+    df["date"] = df["date"].dt.date
+    df.rename(columns={"ticker": "symbol", "date": "date_stamp"}, inplace=True)
+    df["symbol"] = get_price_symbols(df["symbol"], asset_category)
+    return df
+
+
+def main(n_tickers: int = 1500, n_days: int = 252 * 5, repeat: int = 3) -> None:
+    df = make_wide_prices(n_tickers, n_days)
+    print(f"{n_tickers} tickers x {n_days} days ({df.size:,} cells)")
+
+    pd.testing.assert_frame_equal(
+        transform_price_df(df, "sp_stocks"), stack_transform_price_df(df, "sp_stocks")
+    )
+
+    for name, func in (
+        ("stack", stack_transform_price_df),
+        ("vectorized", transform_price_df),
+    ):
+        seconds = min(
+            timeit.repeat(lambda: func(df, "sp_stocks"), number=1, repeat=repeat)
+        )
+        print(f"{name:>10}: {seconds:.3f}s")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,25 @@
+import pytest
+
+from benchmarks.synthetic import make_stock_symbols, make_wide_prices_for_years
+from py_pipeline.transform import transform_price_df, transform_stocks_symbol_df
+
+
+@pytest.fixture
+def wide_prices(n_tickers, n_years):
+    return make_wide_prices_for_years(n_tickers, n_years)
+
+
+def test_transform_price_df(benchmark, wide_prices):
+    long_prices = benchmark(transform_price_df, wide_prices, "sp_stocks")
+
+    assert len(long_prices) == wide_prices.shape[0] * len(
+        wide_prices.columns.unique("Ticker")
+    )
+
+
+def test_transform_stocks_symbol_df(benchmark, n_tickers):
+    symbols = make_stock_symbols(n_tickers)
+
+    transformed = benchmark(transform_stocks_symbol_df, symbols, "2025-01-02")
+
+    assert len(transformed) == n_tickers
@@ -0,0 +1,22 @@
+import pytest
+
+from benchmarks.synthetic import make_wide_prices_for_years
+from py_pipeline.transform import transform_price_df
+from py_pipeline.validate import raw_price_schema, transformed_price_schema, validate_df
+
+
+@pytest.fixture
+def wide_prices(n_tickers, n_years):
+    return make_wide_prices_for_years(n_tickers, n_years)
+
+
+@pytest.mark.parametrize("mode", ("full", "sample"))
+def test_validate_raw_prices(benchmark, wide_prices, mode):
+    benchmark(validate_df, wide_prices, raw_price_schema, mode)
+
+
+@pytest.mark.parametrize("mode", ("full", "sample"))
+def test_validate_transformed_prices(benchmark, wide_prices, mode):
+    long_prices = transform_price_df(wide_prices, "sp_stocks", "skip")
+
+    benchmark(validate_df, long_prices, transformed_price_schema, mode)
@@ -0,0 +1,89 @@
+-- Benchmark of the ffill_candles macro on a synthetic price table.
+--
+-- Compile the variant to time and run the compiled SQL from
+-- target/compiled/sec_dw_transformer/analyses, e.g. with explain analyze on
+-- Postgres or from the query profile on Snowflake:
+--
+--   dbt compile -s ffill_candles_benchmark --vars '{ffill_benchmark_variant: single_pass}'
+--   dbt compile -s ffill_candles_benchmark --vars '{ffill_benchmark_variant: per_column}'
+--
+-- "per_column" is the previous macro, which evaluates a last_value window for
+-- each of open, high, low and close. Both variants give the same candles, and
+-- the query returns their count and sums so they can be compared.
+
+{% set variant = var('ffill_benchmark_variant', 'single_pass') %}
+{% set n_symbols = var('ffill_benchmark_symbols', 500) %}
+{% set n_days = var('ffill_benchmark_days', 2520) %}
+
+with symbols as (
+    {{ dbt_utils.generate_series(n_symbols) }}
+),
+
+days as (
+    {{ dbt_utils.generate_series(n_days) }}
+),
+
+candles as (
+    -- Every 10th candle of a symbol is missing
+    select
+        {{ dbt.dateadd('day', 'days.generated_number', "cast('2000-01-01' as date)") }} as date_stamp,
+        'S' || cast(symbols.generated_number as varchar) as symbol,
+        case when mod(days.generated_number + symbols.generated_number, 10) <> 0
+            then 100 + mod(days.generated_number * symbols.generated_number, 997) / 100.0
+        end as open,
+        case when mod(days.generated_number + symbols.generated_number, 10) <> 0
+            then 101 + mod(days.generated_number * symbols.generated_number, 997) / 100.0
+        end as high,
+        case when mod(days.generated_number + symbols.generated_number, 10) <> 0
+            then 99 + mod(days.generated_number * symbols.generated_number, 997) / 100.0
+        end as low,
+        case when mod(days.generated_number + symbols.generated_number, 10) <> 0
+            then 100 + mod(days.generated_number * symbols.generated_number, 991) / 100.0
+        end as close,
+        case when mod(days.generated_number + symbols.generated_number, 10) <> 0
+            then days.generated_number * 1000
+        end as volume
+    from symbols
+    cross join days
+),
+
+{% if variant == 'single_pass' %}
+filled as (
+    {{ ffill_candles('candles', 'symbol') }}
+)
+{% elif variant == 'per_column' %}
+filled as (
+    select
+        date_stamp,
+        symbol,
+        case
+            when open is null then last_value(close) over (partition by symbol order by date_stamp rows between unbounded preceding and 1 preceding)
+            else open
+        end as open,
+        case
+            when high is null then last_value(close) over (partition by symbol order by date_stamp rows between unbounded preceding and 1 preceding)
+            else high
+        end as high,
+        case
+            when low is null then last_value(close) over (partition by symbol order by date_stamp rows between unbounded preceding and 1 preceding)
+            else low
+        end as low,
+        case
+            when close is null then last_value(close) over (partition by symbol order by date_stamp rows between unbounded preceding and 1 preceding)
+            else close
+        end as close,
+        case when volume is null then 0 else volume end as volume
+    from candles
+)
+{% else %}
+{{ exceptions.raise_compiler_error("Unknown ffill_benchmark_variant: " ~ variant) }}
+{% endif %}
+
+select
+    count(*) as candles,
+    sum(open) as open,
+    sum(high) as high,
+    sum(low) as low,
+    sum(close) as close,
+    sum(volume) as volume
+from filled
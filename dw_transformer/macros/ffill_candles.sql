@@ -1,19 +1,16 @@
-{% macro ffill_candles(partition_column) -%}
-    case
-        when open is null then last_value(close) over (partition by {{ partition_column }} order by date_stamp rows between unbounded preceding and 1 preceding)
-        else open
-    end as open,
-    case
-        when high is null then last_value(close) over (partition by {{ partition_column }} order by date_stamp rows between unbounded preceding and 1 preceding)
-        else high
-    end as high,
-    case
-        when low is null then last_value(close) over (partition by {{ partition_column }} order by date_stamp rows between unbounded preceding and 1 preceding)
-        else low
-    end as low,
-    case
-        when close is null then last_value(close) over (partition by {{ partition_column }} order by date_stamp rows between unbounded preceding and 1 preceding)
-        else close
-    end as close,
-    case when volume is null then 0 else volume end as volume
-{%- endmacro %}
\ No newline at end of file
+{% macro ffill_candles(relation, partition_column) -%}
+    select
+        date_stamp,
+        {{ partition_column }},
+        coalesce(open, prev_close) as open,
+        coalesce(high, prev_close) as high,
+        coalesce(low, prev_close) as low,
+        coalesce(close, prev_close) as close,
+        coalesce(volume, 0) as volume
+    from (
+        select
+            *,
+            lag(close) over (partition by {{ partition_column }} order by date_stamp) as prev_close
+        from {{ relation }}
+    ) as candles
+{%- endmacro %}
@@ -0,0 +1,6 @@
+{% macro price_lookback_start(lookback_days, where=none) -%}
+    {%- set latest_date_stamp -%}
+        (select coalesce(max(date_stamp), cast('1900-01-01' as date)) from {{ this }}{% if where %} where {{ where }}{% endif %})
+    {%- endset -%}
+    {{ dbt.dateadd('day', -lookback_days, latest_date_stamp) }}
+{%- endmacro %}
@@ -1,3 +1,14 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key=['date_stamp', 'symbol'],
+    )
+}}
+
+-- The symbols only filter incremental runs, so their dependencies are declared here
+-- depends_on: {{ ref('stg_fx_symbols') }}
+-- depends_on: {{ ref('stg_stock_symbols') }}
+
 with prices as (
     select
         date_stamp,
@@ -8,6 +19,12 @@ with prices as (
         close,
         volume
     from {{ ref('stg_fx_prices') }}
+    {% if is_incremental() %}
+    where date_stamp >= {{ price_lookback_start(
+        var('price_lookback_days'),
+        where="symbol in (select symbol from " ~ ref('stg_fx_symbols') ~ ")",
+    ) }}
+    {% endif %}
     union all
     select
         date_stamp,
@@ -18,6 +35,12 @@ with prices as (
         close,
         volume
     from {{ ref('stg_stock_prices') }}
+    {% if is_incremental() %}
+    where date_stamp >= {{ price_lookback_start(
+        var('price_lookback_days'),
+        where="symbol in (select symbol from " ~ ref('stg_stock_symbols') ~ ")",
+    ) }}
+    {% endif %}
 )
 
 select *
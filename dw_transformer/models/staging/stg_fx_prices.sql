@@ -1,3 +1,10 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key=['date_stamp', 'symbol'],
+    )
+}}
+
 with base_ as (
     select
     cast(date_stamp as date) as date_stamp,
@@ -20,14 +27,17 @@ with base_ as (
     end as close,
     cast(volume as bigint) as volume
 from {{ source("raw", "price_history_fx") }}
+{% if is_incremental() %}
+-- Rows before the lookback window are read to fill the first rows in it
+where date_stamp >= {{ price_lookback_start(2 * var('price_lookback_days')) }}
+{% endif %}
 ),
  ffill as (
-    select
-        date_stamp,
-        symbol,
-        {{ ffill_candles('symbol') }}
-    from base_
+    {{ ffill_candles('base_', 'symbol') }}
 )
 
 select *
-from ffill
\ No newline at end of file
+from ffill
+{% if is_incremental() %}
+where date_stamp >= {{ price_lookback_start(var('price_lookback_days')) }}
+{% endif %}
\ No newline at end of file
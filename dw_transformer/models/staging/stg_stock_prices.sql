@@ -1,3 +1,10 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key=['date_stamp', 'symbol'],
+    )
+}}
+
 with base_ as (
     select
         cast(date_stamp as date) as date_stamp,
@@ -8,13 +15,16 @@ with base_ as (
         round(cast(close as decimal), 2) as close,
         cast(volume as bigint) as volume
     from {{ source("raw", "price_history_sp_stocks") }}
+    {% if is_incremental() %}
+    -- Rows before the lookback window are read to fill the first rows in it
+    where date_stamp >= {{ price_lookback_start(2 * var('price_lookback_days')) }}
+    {% endif %}
 ),
  ffilled as (
-    select
-        date_stamp,
-        symbol,
-        {{ ffill_candles('symbol') }}
-    from base_
+    {{ ffill_candles('base_', 'symbol') }}
  )
 
- select * from ffilled
\ No newline at end of file
+ select * from ffilled
+ {% if is_incremental() %}
+ where date_stamp >= {{ price_lookback_start(var('price_lookback_days')) }}
+ {% endif %}
\ No newline at end of file
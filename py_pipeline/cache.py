@@ -0,0 +1,293 @@
+import datetime as dt
+import hashlib
+import json
+import os
+import threading
+from collections.abc import Callable
+from pathlib import Path
+
+import pandas as pd
+
+
+class PriceCache:
+    """
+    Local on-disk cache of price bars downloaded from the source.
+
+    Bars are stored as one Parquet file per symbol and requested date range, named
+    after a hash of the symbol, interval, adjustment mode and date range. A request
+    is served from the cached ranges that cover it, and only the missing date
+    ranges are downloaded. Entries older than `ttl` are ignored and removed, and
+    the least recently used entries are removed when the cache grows beyond
+    `max_bytes`.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        ttl: dt.timedelta = dt.timedelta(hours=24),
+        max_bytes: int = 1024**3,
+        interval: str = "1d",
+        auto_adjust: bool = True,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.auto_adjust = auto_adjust
+        self._lock = threading.Lock()
+
+    def get_prices(
+        self,
+        symbols: list[str],
+        start_date: dt.date,
+        end_date: dt.date,
+        download: Callable[[list[str], dt.date, dt.date], pd.DataFrame],
+    ) -> pd.DataFrame:
+        """
+        Get wide price bars for `symbols` in [start_date, end_date).
+
+        `download` is called once for every distinct missing date range, with the
+        symbols missing that range. Symbols without data in a downloaded range are
+        not cached, so they are requested again on the next call.
+        """
+        # The index is only locked while it is read and written, so that calls
+        # running at the same time download their missing ranges concurrently
+        with self._lock:
+            entries = self._load_index()
+            now = dt.datetime.now(dt.timezone.utc)
+            entries = self._remove_expired(entries, now)
+            self._save_index(entries)
+
+        gaps_by_symbol = {
+            symbol: self._get_gaps(entries, symbol, start_date, end_date)
+            for symbol in symbols
+        }
+        symbols_by_gap = {}
+        for symbol, gaps in gaps_by_symbol.items():
+            for gap in gaps:
+                symbols_by_gap.setdefault(gap, []).append(symbol)
+
+        stored = []
+        for (gap_start, gap_end), gap_symbols in symbols_by_gap.items():
+            bars = download(gap_symbols, gap_start, gap_end)
+            stored += self._store(bars, gap_symbols, gap_start, gap_end, now)
+
+        with self._lock:
+            # A call running at the same time may have evicted the same ranges
+            stored = [
+                entry
+                for entry in stored
+                if self.cache_dir.joinpath(f"{entry['key']}.parquet").exists()
+            ]
+            stored_keys = {entry["key"] for entry in stored}
+            entries = [
+                entry for entry in self._load_index() if entry["key"] not in stored_keys
+            ] + stored
+
+            frames = {}
+            for symbol in symbols:
+                frame = self._read(entries, symbol, start_date, end_date, now)
+                if frame is not None:
+                    frames[symbol] = frame
+
+            entries = self._evict(entries)
+            self._save_index(entries)
+
+        if not frames:
+            return pd.DataFrame()
+
+        bars = pd.concat(frames, axis=1, names=["Ticker", "Price"])
+        return bars.swaplevel(axis=1).sort_index(axis=1)
+
+    def _key(self, symbol: str, start_date: dt.date, end_date: dt.date) -> str:
+        key = f"{symbol}|{self.interval}|{self.auto_adjust}|{start_date}|{end_date}"
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _matches(self, entry: dict, symbol: str) -> bool:
+        return (
+            entry["symbol"] == symbol
+            and entry["interval"] == self.interval
+            and entry["auto_adjust"] == self.auto_adjust
+        )
+
+    def _get_gaps(
+        self, entries: list[dict], symbol: str, start_date: dt.date, end_date: dt.date
+    ) -> list[tuple[dt.date, dt.date]]:
+        """Get the date ranges in [start_date, end_date) not covered by the cache."""
+        covered = sorted(
+            (dt.date.fromisoformat(entry["start"]), dt.date.fromisoformat(entry["end"]))
+            for entry in entries
+            if self._matches(entry, symbol)
+        )
+
+        gaps = []
+        cursor = start_date
+        for covered_start, covered_end in covered:
+            if covered_end <= cursor:
+                continue
+            if covered_start >= end_date:
+                break
+            if covered_start > cursor:
+                gaps.append((cursor, covered_start))
+            cursor = max(cursor, covered_end)
+        if cursor < end_date:
+            gaps.append((cursor, end_date))
+
+        return gaps
+
+    def _store(
+        self,
+        bars: pd.DataFrame,
+        symbols: list[str],
+        start_date: dt.date,
+        end_date: dt.date,
+        now: dt.datetime,
+    ) -> list[dict]:
+        if bars is None or bars.empty:
+            return []
+
+        entries = []
+        for symbol in symbols:
+            if symbol not in bars.columns.get_level_values("Ticker"):
+                continue
+            symbol_bars = bars.xs(symbol, level="Ticker", axis=1)
+            if symbol_bars.isna().all().all():
+                continue  # Failed downloads are not cached
+
+            key = self._key(symbol, start_date, end_date)
+            path = self.cache_dir.joinpath(f"{key}.parquet")
+            tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+            symbol_bars.to_parquet(tmp_path)
+            os.replace(tmp_path, path)
+            entries.append(
+                {
+                    "key": key,
+                    "symbol": symbol,
+                    "interval": self.interval,
+                    "auto_adjust": self.auto_adjust,
+                    "start": start_date.isoformat(),
+                    "end": end_date.isoformat(),
+                    "created_at": now.isoformat(),
+                    "accessed_at": now.isoformat(),
+                    "size": path.stat().st_size,
+                }
+            )
+
+        return entries
+
+    def _read(
+        self,
+        entries: list[dict],
+        symbol: str,
+        start_date: dt.date,
+        end_date: dt.date,
+        now: dt.datetime,
+    ) -> pd.DataFrame | None:
+        frames = []
+        for entry in entries:
+            if not self._matches(entry, symbol):
+                continue
+            entry_start = dt.date.fromisoformat(entry["start"])
+            entry_end = dt.date.fromisoformat(entry["end"])
+            if entry_end <= start_date or entry_start >= end_date:
+                continue
+
+            frames.append(
+                pd.read_parquet(self.cache_dir.joinpath(f"{entry['key']}.parquet"))
+            )
+            entry["accessed_at"] = now.isoformat()
+
+        if not frames:
+            return None
+
+        frame = pd.concat(frames).sort_index()
+        frame = frame[~frame.index.duplicated(keep="last")]
+        dates = frame.index.date
+        return frame[(dates >= start_date) & (dates < end_date)]
+
+    def _remove_expired(self, entries: list[dict], now: dt.datetime) -> list[dict]:
+        expired = [
+            entry
+            for entry in entries
+            if now - dt.datetime.fromisoformat(entry["created_at"]) > self.ttl
+        ]
+        self._remove_files(expired)
+        return [entry for entry in entries if entry not in expired]
+
+    def _evict(self, entries: list[dict]) -> list[dict]:
+        """Remove the least recently used entries until the cache fits max_bytes."""
+        entries = sorted(entries, key=lambda entry: entry["accessed_at"])
+        total_size = sum(entry["size"] for entry in entries)
+
+        evicted = []
+        while entries and total_size > self.max_bytes:
+            entry = entries.pop(0)
+            evicted.append(entry)
+            total_size -= entry["size"]
+
+        self._remove_files(evicted)
+        return entries
+
+    def _remove_files(self, entries: list[dict]) -> None:
+        for entry in entries:
+            self.cache_dir.joinpath(f"{entry['key']}.parquet").unlink(missing_ok=True)
+
+    def _load_index(self) -> list[dict]:
+        index_path = self.cache_dir.joinpath(self.INDEX_FILE)
+        if not index_path.exists():
+            return []
+        with open(index_path) as f:
+            return json.load(f)
+
+    def _save_index(self, entries: list[dict]) -> None:
+        index_path = self.cache_dir.joinpath(self.INDEX_FILE)
+        tmp_path = index_path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, index_path)
+
+
+class PageTableCache:
+    """
+    Local on-disk cache of tables parsed from web pages.
+
+    The table of each page is stored as a Parquet file named after a hash of the
+    URL, along with the ETag and Last-Modified headers of the response it was
+    parsed from. Those headers let the page be requested conditionally, so an
+    unchanged page is neither downloaded nor parsed again.
+    """
+
+    def __init__(self, cache_dir: str | Path):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def get(self, url: str) -> tuple[pd.DataFrame, dict[str, str]] | None:
+        """Get the cached table of `url` and the headers of its response."""
+        table_path, headers_path = self._paths(url)
+        if not (table_path.exists() and headers_path.exists()):
+            return None
+
+        with open(headers_path) as f:
+            headers = json.load(f)
+        return pd.read_parquet(table_path), headers
+
+    def put(self, url: str, table: pd.DataFrame, headers: dict[str, str]) -> None:
+        table_path, headers_path = self._paths(url)
+        tmp_path = table_path.with_suffix(".tmp")
+        table.to_parquet(tmp_path)
+        os.replace(tmp_path, table_path)
+
+        tmp_path = headers_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(headers, f)
+        os.replace(tmp_path, headers_path)
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return (
+            self.cache_dir.joinpath(f"{key}.parquet"),
+            self.cache_dir.joinpath(f"{key}.json"),
+        )
@@ -1,18 +1,262 @@
 import os
+import threading
+from functools import cache, cached_property, wraps
 from pathlib import Path
+from urllib.parse import urlsplit
+
 from dotenv import load_dotenv
-from prefect_aws import AwsCredentials
-from prefect.blocks.system import Secret
 
 ENV_NAME = os.getenv("ENV_NAME", "dev")
 ENV_PATH = Path(__file__).parent.parent.joinpath(f".env.{ENV_NAME}")
-load_dotenv(ENV_PATH)
 
 PREFECT_AWS_KEY_BLOCK = "sec-datalake-credentials"
 PREFECT_DW_CREDENTIALS_BLOCK = "sec-dw-credentials"
 
-if ENV_NAME == "dev":
-    # Create s3 and database credentials block in prefect development server
+CREDENTIALS_SOURCES = ("prefect", "env")
+STORAGE_BACKENDS = {"s3": "s3", "file": "local"}
+DW_LOADERS = ("dlt", "copy")
+# dbt threads for each database type, used unless DBT_THREADS is set
+DBT_THREADS = {"postgres": 4, "snowflake": 8}
+
+
+class Settings:
+    """
+    Pipeline settings resolved on first access.
+
+    Credentials are loaded from Prefect blocks by default. When `credentials_source`
+    (or the CREDENTIALS_SOURCE environment variable) is "env", they are read from the
+    environment variables used to create the development blocks instead, and no
+    Prefect API call is made.
+
+    The data lake is the S3 bucket named by BUCKET_NAME unless DATA_PATH is set.
+    DATA_PATH can also be a local directory or file:// URL, which is read and
+    written without S3 credentials.
+    """
+
+    def __init__(self, credentials_source: str | None = None):
+        load_dotenv(ENV_PATH)
+        self.credentials_source = credentials_source or os.getenv(
+            "CREDENTIALS_SOURCE", "prefect"
+        )
+        if self.credentials_source not in CREDENTIALS_SOURCES:
+            raise ValueError(f"Unknown credentials source: {self.credentials_source}")
+
+    @cached_property
+    def _aws_credentials(self) -> dict[str, str]:
+        if self.credentials_source == "env":
+            return {
+                "access_key": os.environ["AWS_ACCESS_KEY"],
+                "secret_key": os.environ["AWS_SECRET_KEY"],
+            }
+
+        from prefect_aws import AwsCredentials
+
+        if ENV_NAME == "dev":
+            _save_dev_blocks()
+
+        aws_credentials = AwsCredentials.load(PREFECT_AWS_KEY_BLOCK, _sync=True)
+        return {
+            "access_key": aws_credentials.aws_access_key_id,
+            "secret_key": aws_credentials.aws_secret_access_key.get_secret_value(),
+        }
+
+    @cached_property
+    def _dw_credentials(self) -> dict[str, str]:
+        if self.credentials_source == "env":
+            return {
+                "username": os.getenv("DB_USER"),
+                "password": os.getenv("DB_PASSWORD"),
+                "host": os.getenv("DB_HOST"),
+                "port": os.getenv("DB_PORT"),
+            }
+
+        from prefect.blocks.system import Secret
+
+        if ENV_NAME == "dev":
+            _save_dev_blocks()
+
+        return Secret.load(PREFECT_DW_CREDENTIALS_BLOCK, _sync=True).get()
+
+    def resolve_credentials(self) -> None:
+        """Load the credentials used by the pipeline, e.g. before threads share them."""
+        self._dw_credentials
+        if self.storage_backend == "s3":
+            self._aws_credentials
+
+    # S3 settings
+    @property
+    def aws_access_key(self) -> str:
+        return self._aws_credentials["access_key"]
+
+    @property
+    def aws_secret_key(self) -> str:
+        return self._aws_credentials["secret_key"]
+
+    @property
+    def s3_endpoint(self) -> str:
+        return os.environ["S3_ENDPOINT"]
+
+    @property
+    def bucket_name(self) -> str:
+        return os.environ["BUCKET_NAME"]
+
+    @property
+    def data_path(self) -> str:
+        data_path = os.getenv("DATA_PATH")
+        if not data_path:
+            return f"s3://{self.bucket_name}"
+        elif not urlsplit(data_path).scheme:
+            return Path(data_path).absolute().as_uri()
+        return data_path.rstrip("/")
+
+    @property
+    def storage_backend(self) -> str:
+        scheme = urlsplit(self.data_path).scheme
+        if scheme not in STORAGE_BACKENDS:
+            raise ValueError(f"Unknown data path scheme: {scheme}")
+        return STORAGE_BACKENDS[scheme]
+
+    @property
+    def delta_storage_options(self) -> dict[str, str]:
+        if self.storage_backend == "local":
+            return {}
+        return {
+            "AWS_ACCESS_KEY_ID": self.aws_access_key,
+            "AWS_SECRET_ACCESS_KEY": self.aws_secret_key,
+            "AWS_ENDPOINT_URL": self.s3_endpoint,
+            "AWS_ALLOW_HTTP": "true",
+        }
+
+    # Data lake layout settings
+    @property
+    def price_history_partition(self) -> str | None:
+        return os.getenv("PRICE_HISTORY_PARTITION") or None
+
+    @property
+    def price_history_zorder(self) -> bool:
+        return os.getenv("PRICE_HISTORY_ZORDER", "false").lower() == "true"
+
+    # Source cache settings
+    @property
+    def price_cache_dir(self) -> str | None:
+        return os.getenv("PRICE_CACHE_DIR") or None
+
+    @property
+    def price_cache_ttl_hours(self) -> float:
+        return float(os.getenv("PRICE_CACHE_TTL_HOURS", "24"))
+
+    @property
+    def price_cache_max_mb(self) -> float:
+        return float(os.getenv("PRICE_CACHE_MAX_MB", "1024"))
+
+    @property
+    def symbols_cache_dir(self) -> str | None:
+        return os.getenv("SYMBOLS_CACHE_DIR") or None
+
+    # Async price fetcher settings
+    @property
+    def price_fetch_concurrency(self) -> int:
+        return int(os.getenv("PRICE_FETCH_CONCURRENCY", "8"))
+
+    @property
+    def price_fetch_rate(self) -> float:
+        return float(os.getenv("PRICE_FETCH_RATE", "5"))
+
+    @property
+    def price_fetch_retries(self) -> int:
+        return int(os.getenv("PRICE_FETCH_RETRIES", "3"))
+
+    # Pipeline metrics settings
+    @property
+    def pipeline_metrics_to_s3(self) -> bool:
+        return os.getenv("PIPELINE_METRICS_TO_S3", "false").lower() == "true"
+
+    # Data warehouse settings
+    @property
+    def db_type(self) -> str:
+        return os.environ["DB_TYPE"]
+
+    @property
+    def dw_loader(self) -> str:
+        dw_loader = os.getenv("DW_LOADER", "dlt")
+        if dw_loader not in DW_LOADERS:
+            raise ValueError(f"Unknown DW loader: {dw_loader}")
+        return dw_loader
+
+    @property
+    def dw_rebuild_indexes(self) -> bool:
+        return os.getenv("DW_REBUILD_INDEXES", "false").lower() == "true"
+
+    @property
+    def dw_price_history_partition(self) -> str | None:
+        return os.getenv("DW_PRICE_HISTORY_PARTITION") or None
+
+    # dbt settings
+    @property
+    def dbt_threads(self) -> int:
+        dbt_threads = os.getenv("DBT_THREADS")
+        if dbt_threads:
+            return int(dbt_threads)
+        if self.db_type not in DBT_THREADS:
+            raise ValueError(f"Unknown database type: {self.db_type}")
+        return DBT_THREADS[self.db_type]
+
+    @property
+    def dbt_state_dir(self) -> str | None:
+        return os.getenv("DBT_STATE_DIR") or None
+
+    @property
+    def db_host(self) -> str:
+        return self._dw_credentials.get("host")
+
+    @property
+    def db_port(self) -> str:
+        return self._dw_credentials.get("port")
+
+    @property
+    def db_user(self) -> str:
+        return self._dw_credentials.get("username")
+
+    @property
+    def db_password(self) -> str:
+        return self._dw_credentials.get("password")
+
+    @property
+    def db_name(self) -> str:
+        return os.environ["DB_NAME"]
+
+
+def thread_safe_cache(factory):
+    """
+    Cache the results of `factory` like `functools.cache`, building them under a lock.
+
+    Process wide factories are called from chunk and asset category threads, and
+    `functools.cache` doesn't stop two threads from building the same instance,
+    e.g. two pools or two rate limiters, at the same time.
+    """
+    cached_factory = cache(factory)
+    lock = threading.Lock()
+
+    @wraps(factory)
+    def wrapper(*args, **kwargs):
+        with lock:
+            return cached_factory(*args, **kwargs)
+
+    wrapper.cache_clear = cached_factory.cache_clear
+    return wrapper
+
+
+@thread_safe_cache
+def get_settings() -> Settings:
+    """Return the process wide settings, creating them on first call."""
+    return Settings()
+
+
+@cache
+def _save_dev_blocks() -> None:
+    """Create s3 and database credentials block in prefect development server."""
+    from prefect_aws import AwsCredentials
+    from prefect.blocks.system import Secret
 
     aws_credentials = AwsCredentials(
         aws_access_key_id=os.environ["AWS_ACCESS_KEY"],
@@ -30,19 +274,25 @@ if ENV_NAME == "dev":
     )
     dw_secret.save(PREFECT_DW_CREDENTIALS_BLOCK, overwrite=True, _sync=True)
 
-# Load s3 credentials
-aws_credentials = AwsCredentials.load(PREFECT_AWS_KEY_BLOCK, _sync=True)
-AWS_ACCESS_KEY = aws_credentials.aws_access_key_id
-AWS_SECRET_KEY = aws_credentials.aws_secret_access_key.get_secret_value()
-S3_ENDPOINT = os.environ["S3_ENDPOINT"]
-BUCKET_NAME = os.environ["BUCKET_NAME"]
-DATA_PATH = f"s3://{BUCKET_NAME}"
-
-# Load database connection
-dw_credentials = Secret.load(PREFECT_DW_CREDENTIALS_BLOCK, _sync=True).get()
-DB_TYPE = os.environ["DB_TYPE"]
-DB_HOST = dw_credentials.get("host")
-DB_PORT = dw_credentials.get("port")
-DB_USER = dw_credentials.get("username")
-DB_PASSWORD = dw_credentials.get("password")
-DB_NAME = os.environ["DB_NAME"]
+
+_SETTINGS_CONSTANTS = (
+    "AWS_ACCESS_KEY",
+    "AWS_SECRET_KEY",
+    "S3_ENDPOINT",
+    "BUCKET_NAME",
+    "DATA_PATH",
+    "DB_TYPE",
+    "DB_HOST",
+    "DB_PORT",
+    "DB_USER",
+    "DB_PASSWORD",
+    "DB_NAME",
+)
+
+
+def __getattr__(name: str):
+    # Keep `from py_pipeline.config import DATA_PATH` style imports working while
+    # deferring credential lookups until a value is actually used.
+    if name in _SETTINGS_CONSTANTS:
+        return getattr(get_settings(), name.lower())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,21 +1,32 @@
 import datetime as dt
+import itertools
+import threading
+from collections.abc import Iterator
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import yfinance as yf
 from deltalake import DeltaTable
+from deltalake.exceptions import DeltaError, TableNotFoundError
 
-from py_pipeline.config import (
-    AWS_ACCESS_KEY,
-    AWS_SECRET_KEY,
-    DATA_PATH,
-    S3_ENDPOINT,
-    ENV_NAME,
-)
+from py_pipeline.cache import PageTableCache, PriceCache
+from py_pipeline.config import ENV_NAME, get_settings, thread_safe_cache
+from py_pipeline.fetcher import AsyncPriceFetcher, ConstituentsFetcher
+
+SP_CONSTITUENTS_URL = "https://en.wikipedia.org/wiki/List_of_S%26P_{}_companies"
+
+# Every symbol loaded so far, with the date_stamp of its latest snapshot
+SYMBOLS_UNIVERSE_DATASET = "symbols_universe"
+
+# Change data feed rows holding the values of inserted and updated rows
+CHANGE_TYPES = ["insert", "update_postimage"]
 
 
 def extract(
     dataset: str, asset_category: str, source: str = "source", **kwargs
-) -> pd.DataFrame | list[str]:
+) -> pd.DataFrame | pa.Table | Iterator[pa.RecordBatch] | list[str]:
     if source == "source":
         if dataset == "symbols":
             if asset_category == "sp_stocks":
@@ -42,21 +53,26 @@ def extract(
 ######### Symbols data extractors #########
 
 
+@thread_safe_cache
+def get_constituents_fetcher() -> ConstituentsFetcher:
+    """Return the process wide fetcher of the S&P constituents tables."""
+    cache_dir = get_settings().symbols_cache_dir
+    return ConstituentsFetcher(cache=PageTableCache(cache_dir) if cache_dir else None)
+
+
 def get_sp_stock_symbols_from_source() -> pd.DataFrame:
-    url = "https://en.wikipedia.org/wiki/List_of_S%26P_{}_companies"
-    storage_options = {
-        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36"
-    }
+    """
+    Get the S&P 400, 500 and 600 constituents from Wikipedia.
 
-    sp_400 = pd.read_html(url.format(400), storage_options=storage_options)[0].assign(
-        in_sp400=True
-    )
-    sp_500 = pd.read_html(url.format(500), storage_options=storage_options)[0].assign(
-        in_sp500=True
-    )
-    sp_600 = pd.read_html(url.format(600), storage_options=storage_options)[0].assign(
-        in_sp600=True
+    The three pages are downloaded concurrently. When SYMBOLS_CACHE_DIR is set,
+    pages that haven't changed since the last run are served from the cache.
+    """
+    sp_400, sp_500, sp_600 = get_constituents_fetcher().fetch(
+        [SP_CONSTITUENTS_URL.format(index) for index in (400, 500, 600)]
     )
+    sp_400 = sp_400.assign(in_sp400=True)
+    sp_500 = sp_500.assign(in_sp500=True)
+    sp_600 = sp_600.assign(in_sp600=True)
     sp_stocks = pd.concat([sp_400, sp_500, sp_600])
 
     if ENV_NAME == "dev":
@@ -82,8 +98,24 @@ def get_symbols_from_s3(
     symbols_only: bool = True,
     start_date: dt.date | str | None = None,
     end_date: dt.date | str | None = None,
-) -> list[str] | pd.DataFrame:
-    """Extract symbols data from the object store."""
+    as_arrow: bool = False,
+    current: bool = False,
+) -> list[str] | pd.DataFrame | pa.Table:
+    """
+    Extract symbols data from the object store.
+
+    When `as_arrow` is True, the symbols data is returned as a pyarrow Table.
+    When `current` is True, only the symbols of the latest snapshot are returned
+    rather than every symbol loaded so far. sp_stocks symbols lists without a date
+    range are read from the symbols universe table, so the lookup doesn't scan
+    every snapshot.
+    """
+
+    if symbols_only and asset_category == "sp_stocks" and not (start_date and end_date):
+        try:
+            return get_symbols_universe_from_s3(asset_category, current)
+        except TableNotFoundError:
+            pass  # Symbols loaded before the universe table existed
 
     columns = ["symbol"] if symbols_only else None
     filters = None
@@ -93,10 +125,123 @@ def get_symbols_from_s3(
             ("date_stamp", ">=", pd.Timestamp(start_date).date()),
             ("date_stamp", "<=", pd.Timestamp(end_date).date()),
         ]
+    elif asset_category == "sp_stocks" and current:
+        filters = [("date_stamp", "=", _get_latest_date_stamp(asset_category))]
+
+    table = _get_data_from_s3(
+        asset_category, "symbols", filters=filters, columns=columns, as_arrow=True
+    )
+
+    if symbols_only:
+        return pc.unique(table["symbol"]).to_pylist()
+    return table if as_arrow else table.to_pandas()
+
 
-    df = _get_data_from_s3(asset_category, "symbols", filters=filters, columns=columns)
+def get_symbols_universe_from_s3(
+    asset_category: str, current: bool = False
+) -> list[str]:
+    """
+    Get every symbol loaded so far from the symbols universe table.
 
-    return df["symbol"].unique().tolist() if symbols_only else df
+    When `current` is True, only the symbols of the latest snapshot are returned.
+    Raises TableNotFoundError when the universe table doesn't exist.
+    """
+    table = _get_data_from_s3(asset_category, SYMBOLS_UNIVERSE_DATASET, as_arrow=True)
+    if current:
+        latest_date_stamp = pc.max(table["last_date_stamp"])
+        table = table.filter(pc.equal(table["last_date_stamp"], latest_date_stamp))
+    return table["symbol"].to_pylist()
+
+
+def _get_latest_date_stamp(asset_category: str) -> dt.date:
+    """Get the date_stamp of the latest symbols snapshot."""
+    try:
+        table = _get_data_from_s3(
+            asset_category,
+            SYMBOLS_UNIVERSE_DATASET,
+            columns=["last_date_stamp"],
+            as_arrow=True,
+        )
+        return pc.max(table["last_date_stamp"]).as_py()
+    except TableNotFoundError:
+        table = _get_data_from_s3(
+            asset_category, "symbols", columns=["date_stamp"], as_arrow=True
+        )
+        return pc.max(table["date_stamp"]).as_py()
+
+
+def get_latest_symbols_from_s3(asset_category: str) -> pd.DataFrame | None:
+    """
+    Get the latest symbols snapshot from the object store.
+
+    For sp_stocks, that is the rows with the latest date_stamp. Returns None when
+    no symbols have been loaded yet.
+    """
+    try:
+        return get_symbols_from_s3(asset_category, symbols_only=False, current=True)
+    except TableNotFoundError:
+        return None
+
+
+def get_delta_table(asset_category: str, data_set: str) -> DeltaTable:
+    """Helper to centralize data lake storage options and Delta table access."""
+    settings = get_settings()
+    path = f"{settings.data_path}/{data_set}/{asset_category}"
+
+    return DeltaTable(path, storage_options=settings.delta_storage_options)
+
+
+def _get_scan_options(
+    delta_table: DeltaTable,
+    columns: list[str] | None = None,
+    filters: list[str, str] | None = None,
+) -> tuple[list[str] | None, list[str, str] | None]:
+    """
+    Adapt columns and filters to the partition layout of a Delta table.
+
+    Partition columns derived from `date_stamp` are left out of the result, and
+    `date_stamp` filters are mirrored on them so whole partitions are skipped.
+    With month partitions, a date bound keeps the years past it and the months
+    past it in its own year. Those alternatives are returned as filters in
+    disjunctive normal form, a list of filter lists.
+    """
+    partition_columns = delta_table.metadata().partition_columns
+    if not partition_columns:
+        return columns, filters
+
+    if columns is None:
+        columns = [
+            field.name
+            for field in delta_table.schema().fields
+            if field.name not in partition_columns
+        ]
+
+    date_filters = [
+        (op, value)
+        for column, op, value in filters or []
+        if column == "date_stamp" and op in (">=", "<=", "=")
+    ]
+    if date_filters and "month" in partition_columns:
+        filters = [
+            filters + list(itertools.chain.from_iterable(alternatives))
+            for alternatives in itertools.product(
+                *(_get_month_filters(op, value) for op, value in date_filters)
+            )
+        ]
+    elif date_filters and "year" in partition_columns:
+        filters = filters + [("year", op, value.year) for op, value in date_filters]
+
+    return columns, filters
+
+
+def _get_month_filters(op: str, value: dt.date) -> list[list[tuple]]:
+    """Helper to get the alternative year and month filters of a date_stamp filter."""
+    if op == "=":
+        return [[("year", "=", value.year), ("month", "=", value.month)]]
+    return [
+        [("year", op.rstrip("="), value.year)],
+        [("year", "=", value.year), ("month", op, value.month)],
+    ]
 
 
 def _get_data_from_s3(
@@ -104,35 +249,231 @@ def _get_data_from_s3(
     data_set: str,
     columns: list[str] | None = None,
     filters: list[str, str] | None = None,
-) -> pd.DataFrame:
-    """Helper to centralize S3 storage options and parquet reading."""
-    s3_storage_options = {
-        "AWS_ACCESS_KEY_ID": AWS_ACCESS_KEY,
-        "AWS_SECRET_ACCESS_KEY": AWS_SECRET_KEY,
-        "AWS_ENDPOINT_URL": S3_ENDPOINT,
-        "AWS_ALLOW_HTTP": "true",
-    }
-    path = f"{DATA_PATH}/{data_set}/{asset_category}"
-
-    return DeltaTable(path, storage_options=s3_storage_options).to_pandas(
-        columns=columns, filters=filters
+    as_arrow: bool = False,
+) -> pd.DataFrame | pa.Table:
+    """Helper to read a Delta table from the object store in one go."""
+    delta_table = get_delta_table(asset_category, data_set)
+    columns, filters = _get_scan_options(delta_table, columns, filters)
+
+    if as_arrow:
+        return delta_table.to_pyarrow_table(columns=columns, filters=filters)
+    return delta_table.to_pandas(columns=columns, filters=filters)
+
+
+def _iter_data_from_s3(
+    asset_category: str,
+    data_set: str,
+    batch_rows: int,
+    columns: list[str] | None = None,
+    filters: list[str, str] | None = None,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Helper to stream a Delta table from the object store in record batches.
+
+    Batches hold at most `batch_rows` rows and are read one at a time, so memory
+    use depends on the batch size rather than on the size of the table.
+    """
+    delta_table = get_delta_table(asset_category, data_set)
+    columns, filters = _get_scan_options(delta_table, columns, filters)
+    batches = delta_table.to_pyarrow_dataset().to_batches(
+        columns=columns,
+        filter=pq.filters_to_expression(filters) if filters else None,
+        batch_size=batch_rows,
+        batch_readahead=1,
+        fragment_readahead=1,
+    )
+    for batch in batches:
+        if batch.num_rows:  # Skip files pruned empty by the filters
+            yield batch
+
+
+def get_changes_from_s3(
+    asset_category: str,
+    data_set: str,
+    primary_key: list[str],
+    synced: dict | None = None,
+    batch_rows: int | None = None,
+) -> tuple[pa.Table | Iterator[pa.RecordBatch], dict]:
+    """
+    Extract the rows inserted or updated in a Delta table since its last sync.
+
+    `synced` is the sync state returned by the previous call. The rows changed
+    in the versions committed since are read from the change data feed, and the
+    latest values of each primary key are returned. When there is no previous
+    sync, the table was recreated since, or the change data feed doesn't cover
+    those versions (it was enabled later or its files were vacuumed), the whole
+    table is returned instead, streamed in batches of `batch_rows` rows when it
+    is set.
+
+    Returns the rows and the sync state to pass to the next call.
+    """
+    delta_table = get_delta_table(asset_category, data_set)
+    state = {"table_id": delta_table.metadata().id, "version": delta_table.version()}
+
+    if synced and synced["table_id"] == state["table_id"]:
+        if synced["version"] >= state["version"]:
+            return iter(()), state
+        try:
+            changes = _get_changes(
+                delta_table, synced["version"] + 1, state["version"], primary_key
+            )
+            return changes, state
+        except DeltaError as e:
+            print(f"Reading the whole {data_set} table, no change data feed: {e}")
+
+    # Rows committed after the state version are read again by the next sync
+    if batch_rows:
+        return _iter_data_from_s3(asset_category, data_set, batch_rows), state
+    return _get_data_from_s3(asset_category, data_set, as_arrow=True), state
+
+
+def _get_changes(
+    delta_table: DeltaTable,
+    starting_version: int,
+    ending_version: int,
+    primary_key: list[str],
+) -> pa.Table:
+    """Helper to read the latest inserted or updated rows from the change data feed."""
+    columns, _ = _get_scan_options(delta_table)
+    if columns is None:
+        columns = [field.name for field in delta_table.schema().fields]
+
+    changes = pa.table(
+        delta_table.load_cdf(
+            starting_version=starting_version, ending_version=ending_version
+        )
+    )
+    # The change data feed is read as string views, which compute functions lack
+    changes = changes.cast(
+        pa.schema(
+            (
+                field.with_type(pa.string())
+                if pa.types.is_string_view(field.type)
+                else field
+            )
+            for field in changes.schema
+        )
+    )
+    changes = changes.filter(pc.is_in(changes["_change_type"], pa.array(CHANGE_TYPES)))
+
+    # Keep the row of the last commit that changed each primary key
+    changes = changes.sort_by("_commit_version")
+    changes = changes.append_column(
+        "_row", pa.array(range(changes.num_rows), pa.int64())
     )
+    latest_rows = changes.group_by(primary_key).aggregate([("_row", "max")])
+    changes = changes.take(latest_rows["_row_max"])
+
+    return changes.select(columns)
 
 
 YF_ERRORS = {"fx": [], "sp_stocks": []}
 
+# Symbols that failed in the downloads of the last `get_prices_from_source` call
+# of each thread, so that chunks downloading at the same time log their own
+_DOWNLOAD_ERRORS = threading.local()
+
+# yf.download keeps its results and errors in module globals, so only one runs at
+# a time. The async fetcher keeps them per call and isn't serialized.
+_YF_DOWNLOAD_LOCK = threading.Lock()
+
+
+@thread_safe_cache
+def get_price_cache() -> PriceCache | None:
+    """Return the process wide source price cache, or None when it is disabled."""
+    settings = get_settings()
+    if not settings.price_cache_dir:
+        return None
+
+    return PriceCache(
+        settings.price_cache_dir,
+        ttl=dt.timedelta(hours=settings.price_cache_ttl_hours),
+        max_bytes=int(settings.price_cache_max_mb * 1024**2),
+    )
+
+
+@thread_safe_cache
+def get_async_price_fetcher() -> AsyncPriceFetcher:
+    """Return the process wide async price fetcher."""
+    settings = get_settings()
+    return AsyncPriceFetcher(
+        max_concurrency=settings.price_fetch_concurrency,
+        rate=settings.price_fetch_rate,
+        max_retries=settings.price_fetch_retries,
+    )
+
 
 def get_prices_from_source(
     symbols: list[str],
     start_date: str | dt.date | None = None,
     end_date: str | dt.date | None = None,
+    fetcher: str = "yfinance",
 ) -> pd.DataFrame:
-    bars = yf.download(symbols, start=start_date, end=end_date, auto_adjust=True)
-    return bars
+    """
+    Download historical price data from Yahoo Finance.
+
+    `fetcher` selects how prices are downloaded: "yfinance" downloads all symbols
+    with `yf.download`, "async" fetches them one symbol at a time with the
+    rate limited `AsyncPriceFetcher`. When the source price cache is enabled and a
+    date range is given, cached bars are reused and only the missing date ranges
+    are downloaded.
+    """
+    errors = _DOWNLOAD_ERRORS.errors = {}
+
+    if fetcher == "yfinance":
+        download_prices = _download_prices
+    elif fetcher == "async":
+        download_prices = _fetch_prices
+    else:
+        raise ValueError(f"Unknown price fetcher: {fetcher}")
+
+    def download(symbols, start_date, end_date):
+        bars, download_errors = download_prices(symbols, start_date, end_date)
+        errors.update(download_errors)
+        return bars
+
+    price_cache = get_price_cache()
+    if price_cache is not None and start_date and end_date:
+        return price_cache.get_prices(
+            symbols,
+            pd.Timestamp(start_date).date(),
+            pd.Timestamp(end_date).date(),
+            download,
+        )
+    return download(symbols, start_date, end_date)
+
+
+def _download_prices(
+    symbols: list[str],
+    start_date: str | dt.date | None = None,
+    end_date: str | dt.date | None = None,
+) -> tuple[pd.DataFrame, dict[str, str]]:
+    with _YF_DOWNLOAD_LOCK:
+        bars = yf.download(symbols, start=start_date, end=end_date, auto_adjust=True)
+        errors = dict(yf.shared._ERRORS)
+    return bars, errors
+
+
+def _fetch_prices(
+    symbols: list[str],
+    start_date: str | dt.date | None = None,
+    end_date: str | dt.date | None = None,
+) -> tuple[pd.DataFrame, dict[str, str]]:
+    start_date, end_date = _get_download_dates(start_date, end_date)
+    return get_async_price_fetcher().fetch(symbols, start_date, end_date)
+
+
+def _get_download_dates(
+    start_date: str | dt.date | None = None, end_date: str | dt.date | None = None
+) -> tuple[dt.date, dt.date]:
+    """Resolve an open date range with the defaults of yf.download."""
+    start_date = pd.Timestamp(start_date or "1950-01-01").date()
+    end_date = pd.Timestamp(end_date).date() if end_date else dt.date.today()
+    return start_date, end_date
 
 
 def log_failed_dowloads(asset_category: str) -> None:
-    symbols_with_errors = yf.shared._ERRORS
+    symbols_with_errors = getattr(_DOWNLOAD_ERRORS, "errors", {})
     if symbols_with_errors:
         YF_ERRORS[asset_category].extend(list(symbols_with_errors.keys()))
 
@@ -141,14 +482,61 @@ def get_prices_from_s3(
     asset_category: str,
     start_date: dt.date | str | None = None,
     end_date: dt.date | str | None = None,
-) -> pd.DataFrame:
-    """Extract historical price data from the object store."""
+    symbols: list[str] | None = None,
+    as_arrow: bool = False,
+    batch_rows: int | None = None,
+) -> pd.DataFrame | pa.Table | Iterator[pa.RecordBatch]:
+    """
+    Extract historical price data from the object store.
 
-    filters = None
+    When `as_arrow` is True, the price data is returned as a pyarrow Table. When
+    `batch_rows` is set, it is streamed as pyarrow RecordBatches of at most
+    `batch_rows` rows instead.
+    """
+
+    filters = []
     if start_date and end_date:
-        filters = [
+        filters += [
             ("date_stamp", ">=", pd.Timestamp(start_date).date()),
             ("date_stamp", "<=", pd.Timestamp(end_date).date()),
         ]
+    if symbols:
+        filters.append(("symbol", "in", symbols))
+
+    if batch_rows:
+        return _iter_data_from_s3(
+            asset_category, "price_history", batch_rows, filters=filters or None
+        )
+    return _get_data_from_s3(
+        asset_category, "price_history", filters=filters or None, as_arrow=as_arrow
+    )
+
+
+def get_price_watermarks_from_s3(
+    asset_category: str, symbols: list[str] | None = None
+) -> dict[str, dt.date]:
+    """
+    Get the latest price date loaded into the object store for each symbol.
 
-    return _get_data_from_s3(asset_category, "price_history", filters=filters)
+    Symbols without price history are left out of the result.
+    """
+
+    filters = [("symbol", "in", symbols)] if symbols else None
+    try:
+        table = _get_data_from_s3(
+            asset_category,
+            "price_history",
+            columns=["symbol", "date_stamp"],
+            filters=filters,
+            as_arrow=True,
+        )
+    except TableNotFoundError:
+        return {}
+
+    watermarks = table.group_by("symbol").aggregate([("date_stamp", "max")])
+    return dict(
+        zip(
+            watermarks["symbol"].to_pylist(),
+            watermarks["date_stamp_max"].to_pylist(),
+        )
+    )
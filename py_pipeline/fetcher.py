@@ -0,0 +1,296 @@
+import asyncio
+import datetime as dt
+import random
+import threading
+import time
+from io import StringIO
+
+import httpx
+import lxml.html
+import pandas as pd
+
+from py_pipeline.cache import PageTableCache
+
+YAHOO_CHART_URL = "https://query2.finance.yahoo.com/v8/finance/chart"
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36"
+
+# Responses worth retrying, other HTTP errors fail the symbol straight away
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+PRICE_COLUMNS = ["Close", "High", "Low", "Open", "Volume"]
+
+# Response headers used to request a cached page conditionally
+CONDITIONAL_HEADERS = {"ETag": "If-None-Match", "Last-Modified": "If-Modified-Since"}
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter shared by asyncio tasks across threads and event loops.
+
+    Tokens are added at `rate` per second up to `capacity`, and each request
+    takes one token, waiting for it when the bucket is empty. Tokens are reserved
+    under a thread lock and waited for outside of it, so concurrent fetches from
+    several threads together start at most `rate` requests per second.
+    """
+
+    def __init__(self, rate: float, capacity: int | None = None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated_at = None
+        self._lock = threading.Lock()
+
+    async def acquire(self) -> None:
+        await asyncio.sleep(self._reserve())
+
+    def _reserve(self) -> float:
+        """Take a token, returning the seconds to wait until it is available."""
+        with self._lock:
+            now = time.monotonic()
+            if self._updated_at is not None:
+                elapsed = now - self._updated_at
+                self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+            # The balance goes negative while tokens are reserved ahead of time
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+
+class AsyncPriceFetcher:
+    """
+    Download daily price bars from the Yahoo Finance chart API one symbol at a time.
+
+    Symbols are fetched concurrently over a shared HTTP client, with at most
+    `max_concurrency` requests in flight per call. The rate limiter is shared by
+    all calls, also from several threads, so at most `rate` requests are started
+    per second by the fetcher as a whole. Throttled and failed requests are retried per symbol with exponential
+    backoff, so a slow or failing symbol doesn't fail the others. `transport`
+    replaces the network transport of the client, e.g. with an
+    `httpx.MockTransport` in tests.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        rate: float = 5.0,
+        max_retries: int = 3,
+        backoff_seconds: float = 1.0,
+        timeout: float = 30.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+        base_url: str = YAHOO_CHART_URL,
+    ):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.transport = transport
+        self.base_url = base_url
+        self.rate_limiter = TokenBucket(rate)
+
+    def fetch(
+        self, symbols: list[str], start_date: dt.date, end_date: dt.date
+    ) -> tuple[pd.DataFrame, dict[str, str]]:
+        """
+        Get wide price bars for `symbols` in [start_date, end_date).
+
+        Returns the bars, shaped like a yfinance download with auto adjusted prices,
+        and the error message of each symbol that couldn't be downloaded.
+        """
+        return asyncio.run(self.fetch_async(symbols, start_date, end_date))
+
+    async def fetch_async(
+        self, symbols: list[str], start_date: dt.date, end_date: dt.date
+    ) -> tuple[pd.DataFrame, dict[str, str]]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"User-Agent": USER_AGENT},
+            timeout=self.timeout,
+            transport=self.transport,
+        ) as client:
+            results = await asyncio.gather(
+                *(
+                    self._fetch_symbol(client, semaphore, symbol, start_date, end_date)
+                    for symbol in symbols
+                ),
+                return_exceptions=True,
+            )
+
+        frames, errors = {}, {}
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                errors[symbol] = repr(result)
+            elif not result.empty:
+                frames[symbol] = result
+
+        if not frames:
+            return pd.DataFrame(), errors
+
+        bars = pd.concat(frames, axis=1, names=["Ticker", "Price"])
+        return bars.swaplevel(axis=1).sort_index(axis=1), errors
+
+    async def _fetch_symbol(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        symbol: str,
+        start_date: dt.date,
+        end_date: dt.date,
+    ) -> pd.DataFrame:
+        # The range is padded by a day on each side since bars are stamped with the
+        # exchange's local time, and trimmed to the requested dates when parsed.
+        params = {
+            "period1": _to_timestamp(start_date - dt.timedelta(days=1)),
+            "period2": _to_timestamp(end_date + dt.timedelta(days=1)),
+            "interval": "1d",
+            "events": "div,splits",
+            "includeAdjustedClose": "true",
+        }
+
+        for attempt in range(self.max_retries + 1):
+            async with semaphore:
+                await self.rate_limiter.acquire()
+                try:
+                    response = await client.get(f"/{symbol}", params=params)
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        response.raise_for_status()
+                        return parse_chart(response.json(), start_date, end_date)
+                    if attempt == self.max_retries:
+                        response.raise_for_status()
+
+            delay = self.backoff_seconds * 2**attempt
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+
+class ConstituentsFetcher:
+    """
+    Download the Wikipedia pages of stock indices concurrently and parse their
+    constituents tables.
+
+    With a `cache`, pages are requested with the ETag and Last-Modified headers
+    of the cached response, and the cached table is used when the page is not
+    modified. `transport` replaces the network transport of the client, e.g. with
+    an `httpx.MockTransport` in tests.
+    """
+
+    def __init__(
+        self,
+        cache: PageTableCache | None = None,
+        timeout: float = 30.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.cache = cache
+        self.timeout = timeout
+        self.transport = transport
+
+    def fetch(self, urls: list[str]) -> list[pd.DataFrame]:
+        """Get the constituents table of each page, in the order of `urls`."""
+        return asyncio.run(self.fetch_async(urls))
+
+    async def fetch_async(self, urls: list[str]) -> list[pd.DataFrame]:
+        async with httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            timeout=self.timeout,
+            transport=self.transport,
+            follow_redirects=True,
+        ) as client:
+            return await asyncio.gather(
+                *(self._fetch_table(client, url) for url in urls)
+            )
+
+    async def _fetch_table(self, client: httpx.AsyncClient, url: str) -> pd.DataFrame:
+        cached = self.cache.get(url) if self.cache else None
+        request_headers = {}
+        if cached:
+            request_headers = {
+                CONDITIONAL_HEADERS[name]: value for name, value in cached[1].items()
+            }
+
+        response = await client.get(url, headers=request_headers)
+        if cached and response.status_code == httpx.codes.NOT_MODIFIED:
+            return cached[0]
+        response.raise_for_status()
+
+        # Parsing is CPU bound, so it runs in a thread to let the other pages download
+        table = await asyncio.to_thread(parse_constituents_table, response.content)
+        if self.cache:
+            headers = {
+                name: response.headers[name]
+                for name in CONDITIONAL_HEADERS
+                if name in response.headers
+            }
+            self.cache.put(url, table, headers)
+        return table
+
+
+def parse_constituents_table(html: bytes) -> pd.DataFrame:
+    """
+    Parse the constituents table of an index's Wikipedia page.
+
+    The page is parsed once with lxml and only the table with the "constituents"
+    id, or the first table when there is none, is converted to a DataFrame.
+    """
+    root = lxml.html.fromstring(html)
+    tables = root.xpath('//table[@id="constituents"]') or root.xpath("//table")
+    if not tables:
+        raise ValueError("No table found in the page")
+
+    table_html = lxml.html.tostring(tables[0], encoding="unicode")
+    return pd.read_html(StringIO(table_html), flavor="lxml")[0]
+
+
+def parse_chart(chart: dict, start_date: dt.date, end_date: dt.date) -> pd.DataFrame:
+    """
+    Convert a chart API response to daily bars with auto adjusted prices.
+
+    Bars are indexed by their date in the exchange's timezone, as naive midnight
+    timestamps like the yfinance daily downloads.
+    """
+    if chart["chart"]["error"]:
+        raise ValueError(chart["chart"]["error"]["description"])
+
+    result = chart["chart"]["result"][0]
+    if not result.get("timestamp"):
+        return pd.DataFrame(columns=pd.Index(PRICE_COLUMNS, name="Price"))
+
+    timezone = result["meta"].get("exchangeTimezoneName", "UTC")
+    dates = (
+        pd.to_datetime(result["timestamp"], unit="s", utc=True)
+        .tz_convert(timezone)
+        .tz_localize(None)
+        .normalize()
+    )
+    quote = result["indicators"]["quote"][0]
+    bars = pd.DataFrame(
+        {
+            "Close": quote["close"],
+            "High": quote["high"],
+            "Low": quote["low"],
+            "Open": quote["open"],
+            "Volume": quote["volume"],
+        },
+        index=pd.DatetimeIndex(dates, name="Date"),
+        dtype="float64",
+    )
+    bars.columns.name = "Price"
+
+    adjclose = result["indicators"].get("adjclose")
+    if adjclose:
+        ratio = pd.Series(adjclose[0]["adjclose"], index=bars.index) / bars["Close"]
+        bars[["High", "Low", "Open"]] = bars[["High", "Low", "Open"]].mul(ratio, axis=0)
+        bars["Close"] = adjclose[0]["adjclose"]
+
+    bars = bars[~bars.index.duplicated(keep="last")]
+    dates = bars.index.date
+    return bars[(dates >= start_date) & (dates < end_date)]
+
+
+def _to_timestamp(date: dt.date) -> int:
+    return int(pd.Timestamp(date, tz="UTC").timestamp())
@@ -1,49 +1,72 @@
+import itertools
+from collections.abc import Iterable
+
 import dlt
 import pandas as pd
+import pyarrow as pa
+
+from py_pipeline.config import get_settings, thread_safe_cache
+from deltalake.exceptions import TableNotFoundError
 
-from py_pipeline.config import (
-    DATA_PATH,
-    AWS_ACCESS_KEY,
-    AWS_SECRET_KEY,
-    S3_ENDPOINT,
-    DB_TYPE,
-    DB_HOST,
-    DB_PORT,
-    DB_USER,
-    DB_PASSWORD,
-    DB_NAME,
+from py_pipeline.extract import (
+    SYMBOLS_UNIVERSE_DATASET,
+    get_changes_from_s3,
+    get_delta_table,
+)
+from py_pipeline.metrics import METRICS_TABLE, metrics_to_arrow
+from py_pipeline.postgres import (
+    copy_to_postgres,
+    create_postgres_table,
+    get_sync_state,
 )
 from py_pipeline.validate import (
     transformed_stock_symbols_schema,
     transformed_fx_symbols_schema,
     transformed_price_schema,
+    validate_df,
 )
 
 dlt.config["load.delete_completed_jobs"] = True
 dlt.config["load.truncate_staging_dataset"] = True
 
+# Partition columns derived from date_stamp for each price history layout
+PRICE_HISTORY_PARTITIONS = {"year": ["year"], "month": ["year", "month"]}
+CHANGE_DATA_FEED_PROPERTY = "delta.enableChangeDataFeed"
+# Price history tables in the data warehouse are indexed or clustered by symbol
+# and date, the order of the dbt window queries
+PRICE_HISTORY_DW_KEY = ["symbol", "date_stamp"]
+
 
 def load(
-    df: pd.DataFrame,
+    df: pd.DataFrame | pa.Table | Iterable[pa.RecordBatch],
     dataset: str,
     asset_category: str,
     destination: str = "s3",
+    validation_mode: str = "full",
 ) -> None:
     if destination == "s3":
-        return load_to_s3(df, dataset, asset_category)
+        return load_to_s3(df, dataset, asset_category, validation_mode)
     elif destination == "dw":
         return load_to_dw(df, dataset, asset_category)
     else:
         raise ValueError(f"Unknown destination: {destination}")
 
 
-def load_to_s3(df: pd.DataFrame, dataset: str, asset_category: str) -> None:
-    """Load price or symbols data into an S3 bucket."""
+def load_to_s3(
+    df: pd.DataFrame, dataset: str, asset_category: str, validation_mode: str = "full"
+) -> None:
+    """
+    Load price or symbols data into an S3 bucket.
+
+    `validation_mode` selects how the transformed data is validated before it is
+    written, see `validate_df`.
+    """
 
     if dataset not in ["symbols", "price_history"]:
         raise ValueError(f"Unknown dataset, {asset_category}")
 
     write_disposition = "merge"
+    partition_columns = []
 
     if dataset == "symbols":
         primary_key = (
@@ -52,45 +75,345 @@ def load_to_s3(df: pd.DataFrame, dataset: str, asset_category: str) -> None:
         if asset_category == "fx":
             write_disposition = "replace"
 
-        df = (
-            transformed_stock_symbols_schema(df, lazy=True)
+        schema = (
+            transformed_stock_symbols_schema
             if asset_category == "sp_stocks"
-            else transformed_fx_symbols_schema(df, lazy=True)
+            else transformed_fx_symbols_schema
         )
+        df = validate_df(df, schema, validation_mode)
     else:
         # For price_history
         primary_key = ["date_stamp", "symbol"]
-        df = transformed_price_schema.validate(df, lazy=True)
-
-    pipeline = dlt.pipeline(
-        pipeline_name=f"sec_s3_loader_{dataset}_{asset_category}",
-        destination=dlt.destinations.filesystem(
-            bucket_url=DATA_PATH,
-            credentials={
-                "aws_access_key_id": AWS_ACCESS_KEY,
-                "aws_secret_access_key": AWS_SECRET_KEY,
-                "endpoint_url": S3_ENDPOINT,
-            },
-        ),
-        dataset_name=dataset,
-    )
+        df = validate_df(df, transformed_price_schema, validation_mode)
+        partition_columns = get_price_history_partition_columns(asset_category)
+        df = add_partition_columns(df, partition_columns)
 
+    pipeline = get_pipeline(dataset, asset_category, destination="s3")
     load_info = pipeline.run(
         df,
         table_name=asset_category,
         write_disposition=write_disposition,
         primary_key=primary_key,
         table_format="delta",
+        columns={column: {"partition": True} for column in partition_columns},
     )
 
     print(load_info)
 
+    if write_disposition == "merge":
+        enable_change_data_feed(asset_category, dataset)
+    if dataset == "symbols" and asset_category == "sp_stocks":
+        load_symbols_universe_to_s3(df, asset_category)
 
-def load_to_dw(df: pd.DataFrame, dataset: str, asset_category: str) -> None:
+
+def load_symbols_universe_to_s3(df: pd.DataFrame, asset_category: str) -> None:
+    """
+    Update the symbols universe table with the symbols snapshot in `df`.
+
+    The table has a row for every symbol loaded so far with the date_stamp of
+    its latest snapshot. It is small and rewritten on each symbols load, so
+    symbols lookups don't have to scan every snapshot. When it doesn't exist
+    yet, it is built from the whole symbols table.
+    """
+    snapshot = df[["symbol", "date_stamp"]].rename(
+        columns={"date_stamp": "last_date_stamp"}
+    )
+    try:
+        universe = get_delta_table(asset_category, SYMBOLS_UNIVERSE_DATASET).to_pandas(
+            columns=["symbol", "last_date_stamp"]
+        )
+        universe = pd.concat([universe, snapshot])
+    except TableNotFoundError:
+        universe = (
+            get_delta_table(asset_category, "symbols")
+            .to_pandas(columns=["symbol", "date_stamp"])
+            .rename(columns={"date_stamp": "last_date_stamp"})
+        )
+
+    universe = universe.groupby("symbol", as_index=False)["last_date_stamp"].max()
+
+    pipeline = get_pipeline(SYMBOLS_UNIVERSE_DATASET, asset_category, destination="s3")
+    load_info = pipeline.run(
+        universe,
+        table_name=asset_category,
+        write_disposition="replace",
+        table_format="delta",
+    )
+
+    print(load_info)
+
+
+def enable_change_data_feed(asset_category: str, dataset: str) -> None:
+    """
+    Enable the change data feed of a Delta table.
+
+    Commits made after it is enabled record the rows they insert and update, so
+    the data warehouse can be synced with the changed rows only, see
+    `load_changes_to_dw`.
+    """
+    delta_table = get_delta_table(asset_category, dataset)
+    if delta_table.metadata().configuration.get(CHANGE_DATA_FEED_PROPERTY) != "true":
+        delta_table.alter.set_table_properties({CHANGE_DATA_FEED_PROPERTY: "true"})
+
+
+def load_metrics_to_s3(records: list[dict]) -> None:
+    """Append measured pipeline stages to the metrics Delta table in the S3 bucket."""
+    pipeline = get_pipeline("metrics", METRICS_TABLE, destination="s3")
+    load_info = pipeline.run(
+        metrics_to_arrow(records),
+        table_name=METRICS_TABLE,
+        write_disposition="append",
+        table_format="delta",
+    )
+
+    print(load_info)
+
+
+def get_price_history_partition_columns(asset_category: str) -> list[str]:
+    """
+    Get the partition columns of the price history Delta table.
+
+    The PRICE_HISTORY_PARTITION setting applies to new tables. Existing tables
+    keep the layout they were created with, since dlt would otherwise add the
+    partition columns of the setting as data columns.
+    """
+    partition = get_settings().price_history_partition
+    if partition is None:
+        partition_columns = []
+    elif partition in PRICE_HISTORY_PARTITIONS:
+        partition_columns = PRICE_HISTORY_PARTITIONS[partition]
+    else:
+        raise ValueError(f"Unknown price history partition: {partition}")
+
+    try:
+        delta_table = get_delta_table(asset_category, "price_history")
+    except TableNotFoundError:
+        return partition_columns
+
+    table_partition_columns = delta_table.metadata().partition_columns
+    if table_partition_columns != partition_columns:
+        print(
+            f"Keeping the partition columns {table_partition_columns} of the "
+            f"{asset_category} price history table, instead of {partition_columns}"
+            " set by PRICE_HISTORY_PARTITION"
+        )
+    return table_partition_columns
+
+
+def add_partition_columns(
+    df: pd.DataFrame, partition_columns: list[str]
+) -> pd.DataFrame:
+    """Derive the year and month partition columns from date_stamp."""
+    if not partition_columns:
+        return df
+
+    dates = pd.to_datetime(df["date_stamp"])
+    return df.assign(
+        **{column: getattr(dates.dt, column) for column in partition_columns}
+    )
+
+
+def load_to_dw(
+    df: pd.DataFrame | pa.Table | Iterable[pa.RecordBatch],
+    dataset: str,
+    asset_category: str,
+    loader: str | None = None,
+) -> None:
     """
     Load price or symbols data into data warehouse.
+
+    Data read from the object store can be passed as a pyarrow Table, which dlt
+    loads without converting it to pandas, or as an iterable of RecordBatches,
+    which dlt consumes one batch at a time.
+
+    `loader` selects how the data is loaded, and defaults to the DW_LOADER
+    setting: "dlt" loads it with a dlt pipeline, "copy" streams it into Postgres
+    with COPY and merges it with one INSERT ... ON CONFLICT, see
+    `copy_to_postgres`. The physical layout of price history tables is managed
+    by either loader, see `get_dw_partition` and `cluster_dw_table`.
+    """
+
+    table_name, primary_key, write_disposition = get_dw_table(dataset, asset_category)
+
+    settings = get_settings()
+    loader = loader or settings.dw_loader
+    if loader == "copy":
+        if settings.db_type != "postgres":
+            raise ValueError(f"The copy loader doesn't support {settings.db_type}")
+        rows = copy_to_postgres(
+            df,
+            table_name,
+            primary_key,
+            write_disposition,
+            rebuild_indexes=settings.dw_rebuild_indexes,
+            partition=get_dw_partition(dataset),
+        )
+        print(f"Copied {rows} rows into {table_name}")
+        return
+    elif loader != "dlt":
+        raise ValueError(f"Unknown DW loader: {loader}")
+
+    pipeline = get_pipeline(dataset, asset_category, destination="dw")
+    load_info = pipeline.run(
+        prepare_dw_table(df, dataset, asset_category),
+        table_name=table_name,
+        write_disposition=write_disposition,
+        primary_key=primary_key,
+    )
+
+    print(load_info)
+    cluster_dw_table(pipeline, dataset, asset_category)
+
+
+def load_changes_to_dw(
+    dataset: str,
+    asset_category: str,
+    batch_rows: int | None = None,
+    loader: str | None = None,
+) -> None:
     """
+    Sync the rows changed in the object store since the last sync into the data
+    warehouse.
+
+    The Delta table version each sync reads is stored with the load, in the dlt
+    pipeline state or, with the copy loader, in the same transaction as the
+    rows. The next sync reads the rows inserted or updated after it from the
+    change data feed, see `get_changes_from_s3`, so corrections to old dates are
+    synced too. The first sync loads the whole table.
+    """
+    table_name, primary_key, write_disposition = get_dw_table(dataset, asset_category)
+    if write_disposition != "merge":
+        raise ValueError(f"Changes can't be synced into {table_name}")
+
+    settings = get_settings()
+    loader = loader or settings.dw_loader
+    if loader == "copy":
+        if settings.db_type != "postgres":
+            raise ValueError(f"The copy loader doesn't support {settings.db_type}")
+        changes, sync_state = get_changes_from_s3(
+            asset_category,
+            dataset,
+            primary_key,
+            get_sync_state(table_name),
+            batch_rows,
+        )
+        rows = copy_to_postgres(
+            changes,
+            table_name,
+            primary_key,
+            write_disposition,
+            rebuild_indexes=settings.dw_rebuild_indexes,
+            sync_state=sync_state,
+            partition=get_dw_partition(dataset),
+        )
+        print(f"Copied {rows} changed rows into {table_name}")
+        return
+    elif loader != "dlt":
+        raise ValueError(f"Unknown DW loader: {loader}")
+
+    @dlt.resource(
+        name=table_name, write_disposition=write_disposition, primary_key=primary_key
+    )
+    def changed_rows():
+        # The state is committed with the loaded rows
+        state = dlt.current.resource_state()
+        changes, state["delta_sync"] = get_changes_from_s3(
+            asset_category, dataset, primary_key, state.get("delta_sync"), batch_rows
+        )
+        if isinstance(changes, pa.Table):
+            changes = [changes]
+        for batch in prepare_dw_table(changes, dataset, asset_category):
+            if batch.num_rows:
+                yield batch
+
+    pipeline = get_pipeline(dataset, asset_category, destination="dw")
+    load_info = pipeline.run(changed_rows())
 
+    print(load_info)
+    cluster_dw_table(pipeline, dataset, asset_category)
+
+
+def get_dw_partition(dataset: str) -> str | None:
+    """Get the partitioning of new Postgres tables of a dataset."""
+    if dataset != "price_history":
+        return None
+    return get_settings().dw_price_history_partition
+
+
+def prepare_dw_table(
+    data: pd.DataFrame | pa.Table | Iterable[pa.RecordBatch],
+    dataset: str,
+    asset_category: str,
+) -> pd.DataFrame | pa.Table | Iterable[pa.RecordBatch]:
+    """
+    Create a Postgres price history table before dlt loads data into it.
+
+    dlt doesn't create indexes or partitioned tables, so the table is created
+    with the layout the copy loader gives it, see `create_postgres_table`. The
+    schema of the table is taken from the data, and the data is returned to be
+    loaded.
+    """
+    if dataset != "price_history" or get_settings().db_type != "postgres":
+        return data
+
+    if isinstance(data, pd.DataFrame):
+        schema = pa.Schema.from_pandas(data, preserve_index=False)
+    elif isinstance(data, pa.Table):
+        schema = data.schema
+    else:
+        batches = iter(data)
+        first_batch = next(batches, None)
+        if first_batch is None:
+            return []
+        data, schema = itertools.chain([first_batch], batches), first_batch.schema
+
+    table_name, primary_key, _ = get_dw_table(dataset, asset_category)
+    create_postgres_table(table_name, schema, primary_key, get_dw_partition(dataset))
+    return data
+
+
+def cluster_dw_table(pipeline: dlt.Pipeline, dataset: str, asset_category: str) -> None:
+    """
+    Set the clustering key of a Snowflake price history table.
+
+    The table is only altered when it isn't clustered by its primary key yet, e.g.
+    after it is created, so loads don't recluster it.
+    """
+    if dataset != "price_history" or get_settings().db_type != "snowflake":
+        return
+
+    table_name, primary_key, _ = get_dw_table(dataset, asset_category)
+    with pipeline.sql_client() as client:
+        *_, schema_name, name = client.make_qualified_table_name_path(
+            table_name, quote=False
+        )
+        rows = client.execute_sql(
+            "SELECT clustering_key FROM information_schema.tables"
+            " WHERE table_schema = %s AND table_name = %s",
+            schema_name,
+            name,
+        )
+        cluster_columns = [
+            client.escape_column_name(column, quote=False) for column in primary_key
+        ]
+        if rows and get_clustering_columns(rows[0][0]) == cluster_columns:
+            return
+
+        table = client.make_qualified_table_name(table_name)
+        cluster_key = ", ".join(map(client.escape_column_name, primary_key))
+        client.execute_sql(f"ALTER TABLE {table} CLUSTER BY ({cluster_key})")
+
+
+def get_clustering_columns(clustering_key: str | None) -> list[str]:
+    """Get the columns of a Snowflake clustering key, e.g. 'LINEAR(A, "B")'."""
+    if not clustering_key:
+        return []
+    columns = clustering_key.removeprefix("LINEAR(").removesuffix(")")
+    return [column.strip().strip('"') for column in columns.split(",")]
+
+
+def get_dw_table(dataset: str, asset_category: str) -> tuple[str, list[str], str]:
+    """Get the name, primary key and write disposition of a data warehouse table."""
     if dataset not in ["symbols", "price_history"]:
         raise ValueError(f"Unknown dataset, {asset_category}")
 
@@ -105,33 +428,64 @@ def load_to_dw(df: pd.DataFrame, dataset: str, asset_category: str) -> None:
             write_disposition = "replace"
     else:
         # For price_history
-        primary_key = ["date_stamp", "symbol"]
+        primary_key = PRICE_HISTORY_DW_KEY
 
-    pipeline = dlt.pipeline(
-        pipeline_name=f"sec_dw_loader_{dataset}_{asset_category}",
-        destination=get_dw_destination(),
-        dataset_name="public",
-    )
+    return table_name, primary_key, write_disposition
 
-    load_info = pipeline.run(
-        df,
-        table_name=table_name,
-        write_disposition=write_disposition,
-        primary_key=primary_key,
-    )
 
-    print(load_info)
+@thread_safe_cache
+def get_pipeline(dataset: str, asset_category: str, destination: str) -> dlt.Pipeline:
+    """
+    Return the dlt pipeline for a dataset and destination.
+
+    Pipelines are created once per process and reused by later loads, so chunked
+    and repeated loads don't rebuild the pipeline, its destination and credentials.
+    Each pipeline gets its own destination since dlt binds it to the pipeline.
+    """
+    if destination == "s3":
+        return dlt.pipeline(
+            pipeline_name=f"sec_s3_loader_{dataset}_{asset_category}",
+            destination=get_s3_destination(),
+            dataset_name=dataset,
+        )
+    elif destination == "dw":
+        return dlt.pipeline(
+            pipeline_name=f"sec_dw_loader_{dataset}_{asset_category}",
+            destination=get_dw_destination(),
+            dataset_name="public",
+        )
+    else:
+        raise ValueError(f"Unknown destination: {destination}")
+
+
+def get_s3_destination():
+    settings = get_settings()
+    if settings.storage_backend == "local":
+        return dlt.destinations.filesystem(bucket_url=settings.data_path)
+    return dlt.destinations.filesystem(
+        bucket_url=settings.data_path,
+        credentials={
+            "aws_access_key_id": settings.aws_access_key,
+            "aws_secret_access_key": settings.aws_secret_key,
+            "endpoint_url": settings.s3_endpoint,
+        },
+    )
 
 
 def get_dw_destination():
-    if DB_TYPE == "postgres":
+    settings = get_settings()
+    db_type = settings.db_type
+    user, password = settings.db_user, settings.db_password
+    host, port, name = settings.db_host, settings.db_port, settings.db_name
+
+    if db_type == "postgres":
         return dlt.destinations.postgres(
-            f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+            f"postgresql://{user}:{password}@{host}:{port}/{name}"
         )
-    elif DB_TYPE == "snowflake":
+    elif db_type == "snowflake":
         return dlt.destinations.snowflake(
-            credentials=f"snowflake://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}",
+            credentials=f"snowflake://{user}:{password}@{host}/{name}",
             keep_staged_files=False,
         )
     else:
-        raise ValueError(f"Unknown database type: {DB_TYPE}")
+        raise ValueError(f"Unknown database type: {db_type}")
@@ -0,0 +1,115 @@
+import time
+
+import pyarrow as pa
+from deltalake import DeltaTable
+
+from py_pipeline.config import get_settings
+from py_pipeline.extract import get_delta_table
+
+DELTA_TABLES = [
+    ("symbols", "fx"),
+    ("symbols", "sp_stocks"),
+    ("symbols_universe", "sp_stocks"),
+    ("price_history", "fx"),
+    ("price_history", "sp_stocks"),
+]
+PRICE_HISTORY_ZORDER_COLUMNS = ["symbol", "date_stamp"]
+# Files smaller than this are left by loads and not yet compacted or Z-ordered
+SMALL_FILE_SIZE = 100 * 1024 * 1024
+
+
+def maintain_delta_table(
+    dataset: str,
+    asset_category: str,
+    target_file_size: int | None = None,
+    retention_hours: int | None = None,
+) -> dict:
+    """
+    Compact, vacuum and checkpoint a Delta table in the object store.
+
+    With the PRICE_HISTORY_ZORDER setting, the price history partitions holding
+    more than one small file, i.e. those written to since the last maintenance,
+    are Z-ordered on symbol and date_stamp before the rest is compacted.
+
+    Returns the number of files and the time taken to open and scan the table
+    before and after the maintenance.
+    """
+    files_before, scan_seconds_before = _get_table_stats(asset_category, dataset)
+
+    delta_table = get_delta_table(asset_category, dataset)
+    partitions_zordered = 0
+    if dataset == "price_history" and get_settings().price_history_zorder:
+        partitions_zordered = zorder_small_file_partitions(
+            delta_table, PRICE_HISTORY_ZORDER_COLUMNS, target_file_size
+        )
+    compact_metrics = delta_table.optimize.compact(target_size=target_file_size)
+    removed_files = delta_table.vacuum(retention_hours=retention_hours, dry_run=False)
+    delta_table.create_checkpoint()
+
+    files_after, scan_seconds_after = _get_table_stats(asset_category, dataset)
+
+    return {
+        "dataset": dataset,
+        "asset_category": asset_category,
+        "version": delta_table.version(),
+        "files_before": files_before,
+        "files_after": files_after,
+        "files_compacted": compact_metrics["numFilesRemoved"],
+        "partitions_zordered": partitions_zordered,
+        "files_vacuumed": len(removed_files),
+        "scan_seconds_before": round(scan_seconds_before, 3),
+        "scan_seconds_after": round(scan_seconds_after, 3),
+    }
+
+
+def zorder_small_file_partitions(
+    delta_table: DeltaTable, columns: list[str], target_file_size: int | None = None
+) -> int:
+    """
+    Z-order the partitions of a Delta table that hold more than one small file.
+
+    Files are small when they are below `target_file_size`, or SMALL_FILE_SIZE.
+    Partitions already Z-ordered into one file per target size are left as they
+    are, so the cost depends on the data loaded since, not on the table size.
+    Unpartitioned tables are one partition. Returns the partitions Z-ordered.
+    """
+    partition_columns = delta_table.metadata().partition_columns
+    files = pa.table(delta_table.get_add_actions(flatten=True)).to_pandas()
+    small_files = files[files["size_bytes"] < (target_file_size or SMALL_FILE_SIZE)]
+    if partition_columns:
+        file_counts = (
+            small_files.groupby([f"partition.{column}" for column in partition_columns])
+            .size()
+            .reset_index(name="files")
+        )
+        partitions = (
+            file_counts[file_counts["files"] > 1]
+            .drop(columns="files")
+            .rename(columns=lambda column: column.removeprefix("partition."))
+            .to_dict("records")
+        )
+    else:
+        partitions = [{}] if len(small_files) > 1 else []
+
+    for partition in partitions:
+        metrics = delta_table.optimize.z_order(
+            columns,
+            partition_filters=[
+                (column, "=", str(value)) for column, value in partition.items()
+            ]
+            or None,
+            target_size=target_file_size,
+        )
+        print(f"Z-ordered partition {partition}: {metrics}")
+
+    return len(partitions)
+
+
+def _get_table_stats(asset_category: str, dataset: str) -> tuple[int, float]:
+    """Count the active files of a table and time opening and scanning it."""
+    start = time.perf_counter()
+    delta_table = get_delta_table(asset_category, dataset)
+    delta_table.to_pyarrow_table(columns=["symbol"])
+    scan_seconds = time.perf_counter() - start
+
+    return len(delta_table.file_uris()), scan_seconds
@@ -0,0 +1,172 @@
+import contextlib
+import contextvars
+import datetime as dt
+import json
+import resource
+import sys
+import threading
+import time
+from collections.abc import Iterable, Iterator
+
+import pandas as pd
+import pyarrow as pa
+
+METRICS_TABLE = "pipeline_stages"
+
+_LABELS = contextvars.ContextVar("metric_labels", default={})
+_RECORDS = []
+_RECORDS_LOCK = threading.Lock()
+
+
+class StageMetrics:
+    """
+    Rows and bytes handled by a measured stage, set while the stage runs.
+
+    `wall_seconds` is set when the stage ends.
+    """
+
+    def __init__(self):
+        self.rows = None
+        self.bytes = None
+        self.wall_seconds = None
+
+    def record_size(self, data) -> None:
+        """Record the rows and bytes of a DataFrame, pyarrow Table or list."""
+        self.rows, self.bytes = get_size(data)
+
+    def count_batches(
+        self, batches: Iterable[pa.RecordBatch]
+    ) -> Iterator[pa.RecordBatch]:
+        """Pass record batches through, adding their rows and bytes as they are read."""
+        self.rows, self.bytes = self.rows or 0, self.bytes or 0
+        for batch in batches:
+            self.rows += batch.num_rows
+            self.bytes += batch.nbytes
+            yield batch
+
+
+@contextlib.contextmanager
+def measure(stage: str, **labels) -> Iterator[StageMetrics]:
+    """
+    Measure the wall time, CPU time and peak memory of a pipeline stage.
+
+    The stage is recorded with the labels set by `metric_labels` and `labels`,
+    along with the rows and bytes set on the yielded `StageMetrics`. CPU time is
+    the process CPU time, so it includes threads running at the same time. The
+    peak memory is that of the process, so `peak_rss_increase_mb` is how much the
+    stage raised it, which is 0 when the stage stays below an earlier peak, and
+    `process_peak_rss_mb` the peak at the end of the stage.
+    """
+    metrics = StageMetrics()
+    started_at = dt.datetime.now(dt.timezone.utc)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    peak_rss_start = get_peak_rss_mb()
+    status = "failed"
+    try:
+        yield metrics
+        status = "completed"
+    finally:
+        metrics.wall_seconds = time.perf_counter() - wall_start
+        peak_rss = get_peak_rss_mb()
+        record = {
+            "stage": stage,
+            "labels": {**_LABELS.get(), **labels},
+            "status": status,
+            "started_at": started_at,
+            "wall_seconds": round(metrics.wall_seconds, 4),
+            "cpu_seconds": round(time.process_time() - cpu_start, 4),
+            "peak_rss_increase_mb": round(peak_rss - peak_rss_start, 1),
+            "process_peak_rss_mb": round(peak_rss, 1),
+            "rows": metrics.rows,
+            "bytes": metrics.bytes,
+        }
+        with _RECORDS_LOCK:
+            _RECORDS.append(record)
+
+
+@contextlib.contextmanager
+def metric_labels(**labels) -> Iterator[None]:
+    """Add labels, e.g. the flow or chunk, to the stages measured in this context."""
+    token = _LABELS.set({**_LABELS.get(), **labels})
+    try:
+        yield
+    finally:
+        _LABELS.reset(token)
+
+
+def get_metrics(clear: bool = False, **labels) -> list[dict]:
+    """
+    Return the stages measured so far in this process.
+
+    With `labels`, only the stages with those labels are returned, and cleared,
+    e.g. the stages of one of the flows running at the same time.
+    """
+    with _RECORDS_LOCK:
+        records = [
+            record
+            for record in _RECORDS
+            if all(record["labels"].get(k) == v for k, v in labels.items())
+        ]
+        if clear:
+            cleared = {id(record) for record in records}
+            _RECORDS[:] = [record for record in _RECORDS if id(record) not in cleared]
+    return records
+
+
+def get_size(data) -> tuple[int | None, int | None]:
+    if isinstance(data, pd.DataFrame):
+        return len(data), int(data.memory_usage(index=False).sum())
+    elif isinstance(data, (pa.Table, pa.RecordBatch)):
+        return data.num_rows, data.nbytes
+    elif isinstance(data, list):
+        return len(data), None
+    return None, None
+
+
+def get_peak_rss_mb() -> float:
+    """Peak resident memory of the process so far."""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak_rss / 1024**2 if sys.platform == "darwin" else peak_rss / 1024
+
+
+def format_metrics(records: list[dict]) -> list[dict]:
+    """Flatten the labels of measured stages into columns, e.g. for a table artifact."""
+    return [
+        {
+            "stage": record["stage"],
+            **record["labels"],
+            **{
+                key: value
+                for key, value in record.items()
+                if key not in ("stage", "labels", "started_at")
+            },
+            "started_at": record["started_at"].isoformat(),
+        }
+        for record in records
+    ]
+
+
+def metrics_to_arrow(records: list[dict]) -> pa.Table:
+    """Convert measured stages to a table with the labels as a JSON column."""
+    schema = pa.schema(
+        [
+            ("stage", pa.string()),
+            ("labels", pa.string()),
+            ("status", pa.string()),
+            ("started_at", pa.timestamp("us", tz="UTC")),
+            ("wall_seconds", pa.float64()),
+            ("cpu_seconds", pa.float64()),
+            ("peak_rss_increase_mb", pa.float64()),
+            ("process_peak_rss_mb", pa.float64()),
+            ("rows", pa.int64()),
+            ("bytes", pa.int64()),
+        ]
+    )
+    return pa.Table.from_pylist(
+        [
+            {**record, "labels": json.dumps(record["labels"], default=str)}
+            for record in records
+        ],
+        schema=schema,
+    )
@@ -1,11 +1,52 @@
+import contextvars
 import datetime as dt
+import json
+import shutil
+import threading
 import pandas as pd
+import pyarrow as pa
+import yaml
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from deltalake.exceptions import TableNotFoundError
 from prefect import flow, task
+from prefect.artifacts import create_table_artifact
 from prefect_dbt import PrefectDbtRunner, PrefectDbtSettings
-from py_pipeline.extract import extract, log_failed_dowloads, YF_ERRORS
-from py_pipeline.load import load
-from py_pipeline.transform import transform
+from py_pipeline.extract import (
+    extract,
+    get_latest_symbols_from_s3,
+    get_price_watermarks_from_s3,
+    log_failed_dowloads,
+    YF_ERRORS,
+)
+from py_pipeline.config import get_settings
+from py_pipeline.load import load, load_changes_to_dw, load_metrics_to_s3
+from py_pipeline.maintenance import DELTA_TABLES, maintain_delta_table
+from py_pipeline.metrics import format_metrics, get_metrics, measure, metric_labels
+from py_pipeline.transform import diff_symbols, get_price_symbols, transform
+
+# dlt merges into the same Delta table can't be committed concurrently. Chunks
+# running in parallel therefore take turns loading, and overlap the rest. Asset
+# categories load into separate tables, so their loads can overlap.
+_S3_LOAD_LOCKS = {asset_category: threading.Lock() for asset_category in YF_ERRORS}
+
+# How the data warehouse is synced with the object store: "window" copies the
+# rows in the date window of the run, "changes" the rows changed since the last
+# sync
+DW_SYNC_MODES = ("window", "changes")
+
+
+class PriceHistoryETLError(RuntimeError):
+    """
+    Raised when the price history of some symbols couldn't be loaded to S3.
+
+    `first_loaded_date` is the earliest start date of the symbol groups that were
+    loaded anyway, or None when nothing was loaded.
+    """
+
+    def __init__(self, message: str, first_loaded_date: dt.date | None = None):
+        super().__init__(message)
+        self.first_loaded_date = first_loaded_date
 
 
 def get_start_end_dates(
@@ -31,40 +72,130 @@ def get_start_end_dates(
 
 @task(log_prints=True)
 def extract_task(dataset: str, asset_category: str, source: str, **kwargs):
-    return extract(dataset, asset_category, source, **kwargs)
+    with measure(
+        "extract", dataset=dataset, asset_category=asset_category, source=source
+    ) as metrics:
+        data = extract(dataset, asset_category, source, **kwargs)
+        metrics.record_size(data)
+    return data
 
 
 @task(log_prints=True)
 def transform_task(df: pd.DataFrame, dataset: str, asset_category: str, **kwargs):
-    return transform(df, dataset, asset_category, **kwargs)
+    with measure("transform", dataset=dataset, asset_category=asset_category) as metrics:
+        df = transform(df, dataset, asset_category, **kwargs)
+        metrics.record_size(df)
+    return df
 
 
 @task(log_prints=True)
-def load_task(df: pd.DataFrame, dataset: str, asset_category: str, destination: str):
-    return load(df, dataset, asset_category, destination)
+def diff_symbols_task(df: pd.DataFrame, asset_category: str) -> dict[str, int]:
+    with measure("diff", dataset="symbols", asset_category=asset_category) as metrics:
+        changes = diff_symbols(df, get_latest_symbols_from_s3(asset_category))
+        metrics.record_size(df)
+    return changes
 
 
-def etl_symbols_source_to_s3(asset_category: str, **t_kwargs):
+@task(log_prints=True)
+def load_task(
+    df: pd.DataFrame | pa.Table,
+    dataset: str,
+    asset_category: str,
+    destination: str,
+    validation_mode: str = "full",
+):
+    with measure(
+        "load", dataset=dataset, asset_category=asset_category, destination=destination
+    ) as metrics:
+        metrics.record_size(df)
+        return load(df, dataset, asset_category, destination, validation_mode)
+
+
+@task(log_prints=True)
+def extract_load_task(
+    dataset: str, asset_category: str, source: str, destination: str, **kwargs
+):
+    # Streamed data is extracted and loaded within one task, so the batches are
+    # consumed by the loader instead of being held as a task result.
+    with measure(
+        "extract_load",
+        dataset=dataset,
+        asset_category=asset_category,
+        source=source,
+        destination=destination,
+    ) as metrics:
+        data = extract(dataset, asset_category, source, **kwargs)
+        return load(metrics.count_batches(data), dataset, asset_category, destination)
+
+
+@task(log_prints=True)
+def sync_changes_task(dataset: str, asset_category: str, **kwargs):
+    with measure(
+        "sync_changes",
+        dataset=dataset,
+        asset_category=asset_category,
+        source="s3",
+        destination="dw",
+    ):
+        return load_changes_to_dw(dataset, asset_category, **kwargs)
+
+
+def get_load_validation_mode(validation_mode: str, revalidate_on_load: bool) -> str:
+    """Return the validation mode for data transformed earlier in the same run."""
+    return validation_mode if revalidate_on_load else "skip"
+
+
+def etl_symbols_source_to_s3(
+    asset_category: str,
+    validation_mode: str = "full",
+    revalidate_on_load: bool = True,
+    skip_unchanged: bool = True,
+    **t_kwargs,
+):
+    """
+    Extract, transform and load the symbols from the source to S3.
+
+    When `skip_unchanged` is True, the symbols are compared with the latest
+    snapshot in S3 and are only loaded when they changed.
+    """
     print(f"Running ETL for {asset_category} symbols from source")
     df = extract_task(dataset="symbols", asset_category=asset_category, source="source")
     df = transform_task(
-        df=df, dataset="symbols", asset_category=asset_category, **t_kwargs
+        df=df,
+        dataset="symbols",
+        asset_category=asset_category,
+        validation_mode=validation_mode,
+        **t_kwargs,
+    )
+    if skip_unchanged:
+        changes = diff_symbols_task(df=df, asset_category=asset_category)
+        if not any(changes.values()):
+            print(f"{asset_category} symbols are unchanged, skipping the load")
+            return
+        print(f"{asset_category} symbols changed: {changes}")
+
+    load_task(
+        df=df,
+        dataset="symbols",
+        asset_category=asset_category,
+        destination="s3",
+        validation_mode=get_load_validation_mode(validation_mode, revalidate_on_load),
     )
-    load_task(df=df, dataset="symbols", asset_category=asset_category, destination="s3")
 
 
-def etl_price_history_source_to_s3(
+def _etl_price_history_chunk_source_to_s3(
     asset_category: str,
     symbols: list[str],
     start_date: str | dt.date | None = None,
     end_date: str | dt.date | None = None,
-    chunk_size: int = 500,
+    validation_mode: str = "full",
+    revalidate_on_load: bool = True,
+    fetcher: str = "yfinance",
 ):
-    def _etl_price_history_source_to_s3(
-        asset_category: str,
-        symbols: list[str],
-        start_date: str | dt.date | None = None,
-        end_date: str | dt.date | None = None,
+    with metric_labels(
+        chunk=f"{symbols[0]}..{symbols[-1]}",
+        chunk_symbols=len(symbols),
+        chunk_start_date=str(start_date),
     ):
         df = extract_task(
             dataset="price_history",
@@ -73,58 +204,207 @@ def etl_price_history_source_to_s3(
             symbols=symbols,
             start_date=start_date,
             end_date=end_date,
+            fetcher=fetcher,
         )
         log_failed_dowloads(asset_category)
         df = transform_task(
-            df=df, dataset="price_history", asset_category=asset_category
-        )
-        if df.empty:  # Source system returns empty datafram if that is unavailable
-            return
-        load_task(
             df=df,
             dataset="price_history",
             asset_category=asset_category,
-            destination="s3",
+            validation_mode=validation_mode,
+        )
+        if df.empty:  # Source system returns empty datafram if that is unavailable
+            return False
+        with _S3_LOAD_LOCKS[asset_category]:
+            load_task(
+                df=df,
+                dataset="price_history",
+                asset_category=asset_category,
+                destination="s3",
+                validation_mode=get_load_validation_mode(
+                    validation_mode, revalidate_on_load
+                ),
+            )
+        return True
+
+
+def get_symbol_watermarks(
+    asset_category: str, symbols: list[str]
+) -> dict[str, dt.date]:
+    """Get the latest date in the S3 price history of each symbol that has one."""
+    price_symbols = dict(
+        zip(symbols, get_price_symbols(pd.Series(symbols), asset_category))
+    )
+    price_watermarks = get_price_watermarks_from_s3(
+        asset_category, list(price_symbols.values())
+    )
+    return {
+        symbol: price_watermarks[price_symbol]
+        for symbol, price_symbol in price_symbols.items()
+        if price_symbol in price_watermarks
+    }
+
+
+def group_symbols_by_start_date(
+    symbols: list[str],
+    watermarks: dict[str, dt.date],
+    start_date: str | dt.date | None = None,
+    end_date: str | dt.date | None = None,
+) -> dict[dt.date | None, list[str]]:
+    """
+    Group symbols by the first date that is missing from their price history.
+
+    Symbols without a watermark start at `start_date`. Symbols that are already up
+    to date with `end_date` (exclusive, as in the source API) are left out.
+    """
+    start_date = pd.Timestamp(start_date).date() if start_date else None
+    end_date = pd.Timestamp(end_date).date() if end_date else None
+
+    groups = {}
+    for symbol in symbols:
+        symbol_start = start_date
+        if symbol in watermarks:
+            next_date = watermarks[symbol] + dt.timedelta(days=1)
+            symbol_start = max(next_date, start_date) if start_date else next_date
+        if symbol_start and end_date and symbol_start >= end_date:
+            continue
+        groups.setdefault(symbol_start, []).append(symbol)
+
+    return groups
+
+
+def etl_price_history_source_to_s3(
+    asset_category: str,
+    symbols: list[str],
+    start_date: str | dt.date | None = None,
+    end_date: str | dt.date | None = None,
+    chunk_size: int = 500,
+    max_workers: int = 1,
+    incremental: bool = False,
+    validation_mode: str = "full",
+    revalidate_on_load: bool = True,
+    fetcher: str = "yfinance",
+) -> dt.date | None:
+    """
+    Extract the price history of `symbols` from the source and load it to S3.
+
+    Returns the earliest start date of the symbol groups that loaded data, leaving
+    out symbols that errored or returned no data, or None when nothing was loaded.
+    """
+    if incremental:
+        watermarks = get_symbol_watermarks(asset_category, symbols)
+        symbol_groups = group_symbols_by_start_date(
+            symbols, watermarks, start_date, end_date
+        )
+        up_to_date = len(symbols) - sum(len(group) for group in symbol_groups.values())
+        print(
+            f"Running incremental ETL for {asset_category} price history: "
+            f"{up_to_date} symbol(s) up to date, "
+            f"{len(symbol_groups)} start date group(s) to extract"
         )
+    else:
+        symbol_groups = {start_date: symbols}
+
+    chunks = [
+        (group_start_date, group[i : i + chunk_size])
+        for group_start_date, group in symbol_groups.items()
+        for i in range(0, len(group), chunk_size)
+    ]
+    chunk_errors: dict[int, Exception] = {}
+    loaded_chunks: list[int] = []
 
-    if len(symbols) > chunk_size:
+    if len(chunks) > 1:
         print(
             f"Running ETL for {asset_category} price history from source in chunks of {chunk_size}"
+            f" with up to {max_workers} concurrent chunk(s)"
         )
-        for i in range(0, len(symbols), chunk_size):
-            chunk = symbols[i : i + chunk_size]
-            _etl_price_history_source_to_s3(
-                asset_category=asset_category,
-                symbols=chunk,
-                start_date=start_date,
-                end_date=end_date,
-            )
+
+    if max_workers > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            # Each chunk runs in a copy of the current context so that its tasks are
+            # tracked under the calling flow run.
+            futures = {
+                i: executor.submit(
+                    contextvars.copy_context().run,
+                    _etl_price_history_chunk_source_to_s3,
+                    asset_category=asset_category,
+                    symbols=chunk,
+                    start_date=chunk_start_date,
+                    end_date=end_date,
+                    validation_mode=validation_mode,
+                    revalidate_on_load=revalidate_on_load,
+                    fetcher=fetcher,
+                )
+                for i, (chunk_start_date, chunk) in enumerate(chunks)
+            }
+            for i, future in futures.items():
+                if future.exception() is not None:
+                    chunk_errors[i] = future.exception()
+                elif future.result():
+                    loaded_chunks.append(i)
     else:
-        _etl_price_history_source_to_s3(
-            asset_category=asset_category,
-            symbols=symbols,
-            start_date=start_date,
-            end_date=end_date,
-        )
+        for i, (chunk_start_date, chunk) in enumerate(chunks):
+            try:
+                loaded = _etl_price_history_chunk_source_to_s3(
+                    asset_category=asset_category,
+                    symbols=chunk,
+                    start_date=chunk_start_date,
+                    end_date=end_date,
+                    validation_mode=validation_mode,
+                    revalidate_on_load=revalidate_on_load,
+                    fetcher=fetcher,
+                )
+            except Exception as e:
+                chunk_errors[i] = e
+            else:
+                if loaded:
+                    loaded_chunks.append(i)
+
+    for i, error in chunk_errors.items():
+        chunk = chunks[i][1]
+        print(f"Chunk {i} ({chunk[0]} to {chunk[-1]}) failed: {error!r}")
+
+    first_loaded_date = min(
+        (chunks[i][0] for i in loaded_chunks if chunks[i][0]), default=None
+    )
 
-    if YF_ERRORS[asset_category]:
-        raise RuntimeError(
+    if YF_ERRORS[asset_category] or chunk_errors:
+        failed_chunks = [chunks[i][1] for i in chunk_errors]
+        raise PriceHistoryETLError(
             f"""
             Failed to get data for some symbols
             Asset category: {asset_category}
             Symbols: {str(YF_ERRORS[asset_category]).replace("'", '"')}
+            Failed chunks: {str(failed_chunks).replace("'", '"')}
             Start date: {start_date}
             End date: {end_date}
-            """
-        )
+            """,
+            first_loaded_date,
+        ) from next(iter(chunk_errors.values()), None)
+
+    return first_loaded_date
 
 
 def el_symbols_s3_to_dw(
     asset_category: str,
     start_date: str | dt.date | None = None,
     end_date: str | dt.date | None = None,
+    sync_mode: str = "window",
 ):
+    """
+    Copy symbols from the object store into the data warehouse.
+
+    See `DW_SYNC_MODES` for the `sync_mode` options. FX symbols are replaced as
+    a whole on each load, so they are always synced in full.
+    """
+    if sync_mode not in DW_SYNC_MODES:
+        raise ValueError(f"Unknown DW sync mode: {sync_mode}")
+
     print(f"Running EL for {asset_category} symbols to DW")
+    if sync_mode == "changes" and asset_category != "fx":
+        sync_changes_task(dataset="symbols", asset_category=asset_category)
+        return
+
     df = extract_task(
         dataset="symbols",
         asset_category=asset_category,
@@ -132,26 +412,100 @@ def el_symbols_s3_to_dw(
         symbols_only=False,
         start_date=start_date,
         end_date=end_date,
+        as_arrow=True,
     )
     load_task(df=df, dataset="symbols", asset_category=asset_category, destination="dw")
 
 
 def el_price_history_s3_to_dw(
-    asset_category: str, start_date: dt.date | None, end_date: dt.date | None
+    asset_category: str,
+    start_date: dt.date | None,
+    end_date: dt.date | None,
+    batch_rows: int | None = None,
+    sync_mode: str = "window",
 ):
+    """
+    Copy price history from the object store into the data warehouse.
+
+    With the "changes" `sync_mode`, the rows inserted or updated since the last
+    sync are copied whatever their date, and the date window is ignored.
+    """
+    if sync_mode not in DW_SYNC_MODES:
+        raise ValueError(f"Unknown DW sync mode: {sync_mode}")
+
     print(f"Running EL for {asset_category} price history to DW")
+    if sync_mode == "changes":
+        sync_changes_task(
+            dataset="price_history",
+            asset_category=asset_category,
+            batch_rows=batch_rows,
+        )
+        return
+
+    if batch_rows:
+        print(f"Streaming price history in batches of up to {batch_rows} rows")
+        extract_load_task(
+            dataset="price_history",
+            asset_category=asset_category,
+            source="s3",
+            destination="dw",
+            start_date=start_date,
+            end_date=end_date,
+            batch_rows=batch_rows,
+        )
+        return
+
     df = extract_task(
         dataset="price_history",
         asset_category=asset_category,
         source="s3",
         start_date=start_date,
         end_date=end_date,
+        as_arrow=True,
     )
     load_task(
         df=df, dataset="price_history", asset_category=asset_category, destination="dw"
     )
 
 
+@task(log_prints=True)
+def publish_stage_metrics_task(asset_category: str | None = None) -> list[dict]:
+    """
+    Publish the stages measured in this run as a table artifact.
+
+    With `asset_category`, only the stages of that asset category are published,
+    leaving those of flows running at the same time for them to publish.
+    """
+    labels = {"asset_category": asset_category} if asset_category else {}
+    records = get_metrics(clear=True, **labels)
+    if not records:
+        return []
+
+    stage_seconds = {}
+    for record in records:
+        stage = record["stage"]
+        stage_seconds[stage] = stage_seconds.get(stage, 0) + record["wall_seconds"]
+    print(
+        "Wall time by stage: "
+        + ", ".join(f"{stage} {sec:.2f}s" for stage, sec in stage_seconds.items())
+    )
+
+    table = format_metrics(records)
+    create_table_artifact(
+        key="pipeline-stage-metrics",
+        table=table,
+        description=(
+            "Wall time, CPU time, peak memory increase, rows and bytes of each stage"
+        ),
+    )
+    if get_settings().pipeline_metrics_to_s3:
+        try:
+            load_metrics_to_s3(records)
+        except Exception as e:  # Metrics must not hide the outcome of the run
+            print(f"Failed to load stage metrics to S3: {e!r}")
+    return table
+
+
 @flow(log_prints=True)
 def etl_flow(
     asset_category: str,
@@ -159,54 +513,164 @@ def etl_flow(
     start_date: str | dt.date | None = None,
     end_date: str | dt.date | None = None,
     chunk_size: int = 500,
+    max_workers: int = 1,
+    batch_rows: int | None = None,
+    incremental: bool = False,
+    validation_mode: str = "full",
+    revalidate_on_load: bool = True,
+    fetcher: str = "yfinance",
+    skip_unchanged_symbols: bool = True,
+    dw_sync_mode: str = "window",
 ):
 
-    start_date, end_date = get_start_end_dates(start_date, end_date)
-
-    if symbols is None:
-        # The source is assumed to provide the current, up-to-date list of symbols.
-        # We stamp this data to align with the price history being extracted.
-        # Note: During a historical backfill, this will result in today's
-        # symbols being stamped with an older date.
-        date_stamp = end_date - dt.timedelta(days=1)
-        etl_symbols_source_to_s3(asset_category, date_stamp=date_stamp)
-
-    # S3 Price History ETL
-    symbols = (
-        extract_task(
-            dataset="symbols",
-            asset_category=asset_category,
-            source="s3",
-            symbols_only=True,
-        )
-        if symbols is None
-        else symbols
-    )
+    # Label the stages with the asset category, including those measured
+    # without it, e.g. validation, so that they are published with the flow
+    with metric_labels(asset_category=asset_category):
+        backfill = incremental and start_date is None
+        start_date, end_date = get_start_end_dates(start_date, end_date)
+
+        if symbols is None:
+            # The source is assumed to provide the current, up-to-date list of symbols.
+            # We stamp this data to align with the price history being extracted.
+            # Note: During a historical backfill, this will result in today's
+            # symbols being stamped with an older date.
+            date_stamp = end_date - dt.timedelta(days=1)
+            etl_symbols_source_to_s3(
+                asset_category,
+                validation_mode=validation_mode,
+                revalidate_on_load=revalidate_on_load,
+                skip_unchanged=skip_unchanged_symbols,
+                date_stamp=date_stamp,
+            )
 
-    try:
-        etl_price_history_source_to_s3(
-            asset_category=asset_category,
-            symbols=symbols,
-            start_date=start_date,
-            end_date=end_date,
-            chunk_size=chunk_size,
+        # S3 Price History ETL
+        symbols = (
+            extract_task(
+                dataset="symbols",
+                asset_category=asset_category,
+                source="s3",
+                symbols_only=True,
+            )
+            if symbols is None
+            else symbols
         )
-    except RuntimeError as e:
-        if len(YF_ERRORS[asset_category]) < len(symbols):
+        default_start_date = start_date
+        if backfill:
+            # Without a start date, incremental runs start at the first day missing
+            # from the price history, so days missed after an outage are loaded
+            watermarks = get_symbol_watermarks(asset_category, symbols)
+            if watermarks:
+                next_date = min(watermarks.values()) + dt.timedelta(days=1)
+                start_date = min(start_date, next_date)
+
+        def el_s3_to_dw(first_loaded_date: dt.date | None) -> None:
+            # Backfills sync the days loaded for the symbols that were extracted,
+            # so a symbol that keeps failing doesn't widen the window of every run
+            window_start = start_date
+            if backfill:
+                window_start = default_start_date
+                if first_loaded_date:
+                    window_start = min(window_start, first_loaded_date)
             el_symbols_s3_to_dw(
-                asset_category=asset_category, start_date=start_date, end_date=end_date
+                asset_category=asset_category,
+                start_date=window_start,
+                end_date=end_date,
+                sync_mode=dw_sync_mode,
             )
             el_price_history_s3_to_dw(
-                asset_category=asset_category, start_date=start_date, end_date=end_date
+                asset_category=asset_category,
+                start_date=window_start,
+                end_date=end_date,
+                batch_rows=batch_rows,
+                sync_mode=dw_sync_mode,
             )
-        raise e
-    else:
-        el_symbols_s3_to_dw(
-            asset_category=asset_category, start_date=start_date, end_date=end_date
-        )
-        el_price_history_s3_to_dw(
-            asset_category=asset_category, start_date=start_date, end_date=end_date
-        )
+
+        try:
+            first_loaded_date = etl_price_history_source_to_s3(
+                asset_category=asset_category,
+                symbols=symbols,
+                start_date=start_date,
+                end_date=end_date,
+                chunk_size=chunk_size,
+                max_workers=max_workers,
+                incremental=incremental,
+                validation_mode=validation_mode,
+                revalidate_on_load=revalidate_on_load,
+                fetcher=fetcher,
+            )
+        except PriceHistoryETLError as e:
+            if len(YF_ERRORS[asset_category]) < len(symbols):
+                el_s3_to_dw(e.first_loaded_date)
+            raise e
+        else:
+            el_s3_to_dw(first_loaded_date)
+        finally:
+            publish_stage_metrics_task(asset_category)
+
+
+@flow(log_prints=True)
+def multi_asset_etl_flow(
+    asset_categories: list[str],
+    start_date: str | dt.date | None = None,
+    end_date: str | dt.date | None = None,
+    chunk_size: int = 500,
+    max_workers: int = 1,
+    batch_rows: int | None = None,
+    incremental: bool = False,
+    validation_mode: str = "full",
+    revalidate_on_load: bool = True,
+    fetcher: str = "yfinance",
+    skip_unchanged_symbols: bool = True,
+    dw_sync_mode: str = "window",
+    run_dbt: bool = True,
+):
+    """
+    Run the ETL of several asset categories at the same time, and then dbt.
+
+    Each asset category runs `etl_flow` as a subflow in its own thread. They
+    share the process, so the settings, credentials, dlt pipelines, connection
+    pools and caches are set up once. With `run_dbt`, `dbt_runner` runs the
+    models downstream of the asset categories as soon as their ETL is done,
+    including after failures that left some data loaded. The ETL errors are
+    raised after that.
+    """
+    get_settings().resolve_credentials()
+
+    with ThreadPoolExecutor(max_workers=len(asset_categories)) as executor:
+        futures = {
+            asset_category: executor.submit(
+                contextvars.copy_context().run,
+                etl_flow,
+                asset_category=asset_category,
+                start_date=start_date,
+                end_date=end_date,
+                chunk_size=chunk_size,
+                max_workers=max_workers,
+                batch_rows=batch_rows,
+                incremental=incremental,
+                validation_mode=validation_mode,
+                revalidate_on_load=revalidate_on_load,
+                fetcher=fetcher,
+                skip_unchanged_symbols=skip_unchanged_symbols,
+                dw_sync_mode=dw_sync_mode,
+            )
+            for asset_category in asset_categories
+        }
+
+    errors = {
+        asset_category: future.exception()
+        for asset_category, future in futures.items()
+        if future.exception() is not None
+    }
+    for asset_category, error in errors.items():
+        print(f"ETL of {asset_category} failed: {error!r}")
+
+    if run_dbt:
+        dbt_runner(asset_categories=asset_categories)
+
+    if errors:
+        first_error = next(iter(errors.values()))
+        raise RuntimeError(f"ETL failed for {', '.join(errors)}") from first_error
 
 
 @task(log_prints=True)
@@ -221,6 +685,7 @@ def create_dbt_profiles(project_dir: Path) -> None:
     )
 
     print(f"Creating profiles.yml for {DB_TYPE}")
+    threads = get_settings().dbt_threads
 
     if DB_TYPE == "postgres":
         profiles_content = f"""sec_dw_transformer:
@@ -233,7 +698,7 @@ def create_dbt_profiles(project_dir: Path) -> None:
             host: {DB_HOST}
             port: {DB_PORT}
             schema: public
-            threads: 1
+            threads: {threads}
     target: dev"""
     elif DB_TYPE == "snowflake":
         profiles_content = f"""sec_dw_transformer:
@@ -246,7 +711,7 @@ def create_dbt_profiles(project_dir: Path) -> None:
             database: {DB_NAME}
             schema: public
             warehouse: "COMPUTE_WH"
-            threads: 1
+            threads: {threads}
     target: dev"""
     else:
         raise ValueError(f"Unknown database type: {DB_TYPE}")
@@ -258,8 +723,63 @@ def create_dbt_profiles(project_dir: Path) -> None:
     print(f"Created/updated profiles.yml at {profiles_path}")
 
 
+def dbt_packages_installed(project_dir: Path) -> bool:
+    """Check whether the dbt packages locked in package-lock.yml are installed."""
+    lock_path = project_dir / "package-lock.yml"
+    if not lock_path.exists():
+        return False
+
+    packages = yaml.safe_load(lock_path.read_text()).get("packages") or []
+    return all(
+        (project_dir / "dbt_packages" / package["name"]).is_dir()
+        for package in packages
+    )
+
+
+def get_dbt_select_args(
+    asset_categories: list[str] | None = None, state_dir: str | None = None
+) -> list[str]:
+    """
+    Get the node selection arguments of the dbt run and test commands.
+
+    With `asset_categories`, the raw sources of those asset categories and the
+    models downstream of them are selected, so models that only read other
+    sources are skipped. When the manifest of a previous run is saved in
+    `state_dir`, the models modified since that run and their children are
+    selected too. Without `asset_categories`, the whole project is selected.
+    """
+    if not asset_categories:
+        return []
+
+    selectors = [
+        f"source:raw.{dataset}_{asset_category}+"
+        for asset_category in asset_categories
+        for dataset in ("symbols", "price_history")
+    ]
+    if state_dir and Path(state_dir, "manifest.json").exists():
+        return ["--select", *selectors, "state:modified+", "--state", state_dir]
+    return ["--select", *selectors]
+
+
 @flow(log_prints=True)
-def dbt_runner() -> None:
+def dbt_runner(
+    full_refresh: bool = False,
+    price_lookback_days: int | None = None,
+    asset_categories: list[str] | None = None,
+) -> None:
+    """
+    Run and test the dbt models.
+
+    The price models are incremental: each run rebuilds the days of their
+    lookback window (`price_lookback_days`, 7 by default) and adds the new ones.
+    Run with `full_refresh` to rebuild them from the whole history, e.g. after a
+    backfill or a correction older than the lookback window.
+
+    With `asset_categories`, only the models downstream of the data loaded for
+    those asset categories are run and tested, see `get_dbt_select_args`. The
+    models run with the DBT_THREADS setting, and `dbt deps` is skipped when the
+    packages are already installed.
+    """
     print("Running dbt")
 
     dbt_project_path = Path(__file__).parent.parent / "dw_transformer"
@@ -269,15 +789,79 @@ def dbt_runner() -> None:
     )
 
     runner = PrefectDbtRunner(settings=settings)
-    runner.invoke(["deps"])
-    runner.invoke(["run"])
-    runner.invoke(["test"])
+    if dbt_packages_installed(dbt_project_path):
+        print("Skipping dbt deps, the packages are installed")
+    else:
+        runner.invoke(["deps"])
+
+    state_dir = get_settings().dbt_state_dir
+    select_args = get_dbt_select_args(asset_categories, state_dir)
+    run_args = ["run", *select_args]
+    if full_refresh:
+        run_args.append("--full-refresh")
+    if price_lookback_days is not None:
+        run_args += ["--vars", json.dumps({"price_lookback_days": price_lookback_days})]
+    runner.invoke(run_args)
+    runner.invoke(["test", *select_args])
+
+    if state_dir:
+        # The manifest of this run is the state the next run is compared with
+        Path(state_dir).mkdir(parents=True, exist_ok=True)
+        shutil.copy(dbt_project_path / "target" / "manifest.json", state_dir)
+
+
+@task(log_prints=True)
+def maintain_delta_table_task(
+    dataset: str,
+    asset_category: str,
+    target_file_size: int | None = None,
+    retention_hours: int | None = None,
+) -> dict | None:
+    try:
+        report = maintain_delta_table(
+            dataset, asset_category, target_file_size, retention_hours
+        )
+    except TableNotFoundError:
+        print(f"Skipping {dataset}/{asset_category}, the table does not exist")
+        return None
+
+    print(
+        f"Maintained {dataset}/{asset_category}: "
+        f"files {report['files_before']} -> {report['files_after']}, "
+        f"scan {report['scan_seconds_before']}s -> {report['scan_seconds_after']}s"
+    )
+    return report
+
+
+@flow(log_prints=True)
+def delta_maintenance_flow(
+    target_file_size: int = 128 * 1024 * 1024, retention_hours: int = 168
+) -> list[dict]:
+    print("Running Delta table maintenance")
+
+    reports = [
+        maintain_delta_table_task(
+            dataset=dataset,
+            asset_category=asset_category,
+            target_file_size=target_file_size,
+            retention_hours=retention_hours,
+        )
+        for dataset, asset_category in DELTA_TABLES
+    ]
+    reports = [report for report in reports if report is not None]
+
+    create_table_artifact(
+        key="delta-maintenance-report",
+        table=reports,
+        description="File counts and scan times before and after Delta maintenance",
+    )
+    return reports
 
 
 if __name__ == "__main__":
     end_date = dt.date.today()
     start_date = end_date - dt.timedelta(days=30)
 
-    etl_flow(asset_category="fx", start_date=start_date, end_date=end_date)
-    etl_flow(asset_category="sp_stocks", start_date=start_date, end_date=end_date)
-    dbt_runner()
+    multi_asset_etl_flow(
+        asset_categories=["fx", "sp_stocks"], start_date=start_date, end_date=end_date
+    )
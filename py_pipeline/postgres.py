@@ -0,0 +1,384 @@
+import datetime as dt
+import io
+import itertools
+from collections.abc import Iterable, Iterator
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+from py_pipeline.config import get_settings, thread_safe_cache
+
+SCHEMA = "public"
+WRITE_DISPOSITIONS = ("merge", "replace")
+
+# Delta table version each table was last synced to, see `get_sync_state`
+SYNC_STATE_TABLE = "_delta_sync_state"
+# Partitioned tables get a partition for each year from this one to next year
+FIRST_PARTITION_YEAR = 2000
+PARTITIONS = ("year",)
+
+
+def copy_to_postgres(
+    data: pd.DataFrame | pa.Table | Iterable[pa.RecordBatch],
+    table_name: str,
+    primary_key: list[str],
+    write_disposition: str = "merge",
+    rebuild_indexes: bool = False,
+    sync_state: dict | None = None,
+    partition: str | None = None,
+) -> int:
+    """
+    Load data into a Postgres table with COPY.
+
+    The data is streamed as CSV into an unlogged staging table, and then written
+    to the table with one INSERT ... ON CONFLICT statement that updates the rows
+    whose primary key is already loaded. With the "replace" disposition the table
+    is truncated first. The table and a unique index on the primary key are
+    created when they don't exist, see `create_postgres_table`.
+
+    With `rebuild_indexes`, the other indexes of the table are dropped before the
+    insert and rebuilt after it, which is faster when a load writes most of the
+    table. With `sync_state`, the Delta table version the data was read at is
+    stored for the next sync. The load runs in one transaction. Returns the
+    number of rows copied.
+    """
+    if write_disposition not in WRITE_DISPOSITIONS:
+        raise ValueError(f"Unknown write disposition: {write_disposition}")
+
+    batches = iter(_to_batches(data))
+    first_batch = next(batches, None)
+    if first_batch is None and sync_state is None:
+        return 0
+
+    pool = get_postgres_pool()
+    connection = pool.getconn()
+    try:
+        with connection, connection.cursor() as cursor:
+            rows = 0
+            if first_batch is not None:
+                rows = _copy_batches(
+                    cursor,
+                    itertools.chain([first_batch], batches),
+                    first_batch.schema,
+                    table_name,
+                    primary_key,
+                    write_disposition,
+                    rebuild_indexes,
+                    partition,
+                )
+            if sync_state is not None:
+                _set_sync_state(cursor, table_name, sync_state)
+    finally:
+        pool.putconn(connection)
+
+    return rows
+
+
+def create_postgres_table(
+    table_name: str,
+    schema: pa.Schema,
+    primary_key: list[str],
+    partition: str | None = None,
+) -> None:
+    """
+    Create a table and a unique index on its primary key when they don't exist.
+
+    The index columns are in the order of `primary_key`. With the "year"
+    `partition`, the table is range partitioned by the year of date_stamp, with
+    a partition for each year from FIRST_PARTITION_YEAR to next year and a
+    default partition for other dates. The partitions of later years are added
+    as they come. Existing tables are not repartitioned, but an existing index
+    with the primary key columns in another order is recreated.
+    """
+    pool = get_postgres_pool()
+    connection = pool.getconn()
+    try:
+        with connection, connection.cursor() as cursor:
+            _create_table(cursor, table_name, schema, primary_key, partition)
+    finally:
+        pool.putconn(connection)
+
+
+def _create_table(
+    cursor,
+    table_name: str,
+    schema: pa.Schema,
+    primary_key: list[str],
+    partition: str | None,
+) -> None:
+    """Helper to create a table and its indexes within the cursor's transaction."""
+    from psycopg2 import sql
+
+    if partition is not None and partition not in PARTITIONS:
+        raise ValueError(f"Unknown DW partition: {partition}")
+
+    table = sql.Identifier(SCHEMA, table_name)
+    statement = sql.SQL("CREATE TABLE IF NOT EXISTS {} ({})").format(
+        table,
+        sql.SQL(", ").join(
+            sql.SQL("{} {}").format(
+                sql.Identifier(field.name),
+                sql.SQL(get_postgres_type(field.type)),
+            )
+            for field in schema
+        ),
+    )
+    if partition == "year":
+        statement += sql.SQL(" PARTITION BY RANGE (date_stamp)")
+    cursor.execute(statement)
+
+    # Indexes created before the primary key order changed are recreated
+    index_name = f"{table_name}_primary_key_idx"
+    index_columns = _get_index_columns(cursor, index_name)
+    if index_columns is not None and index_columns != primary_key:
+        cursor.execute(
+            sql.SQL("DROP INDEX {}").format(sql.Identifier(SCHEMA, index_name))
+        )
+    cursor.execute(
+        sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({})").format(
+            sql.Identifier(index_name),
+            table,
+            sql.SQL(", ").join(map(sql.Identifier, primary_key)),
+        )
+    )
+
+    cursor.execute(
+        "SELECT EXISTS (SELECT FROM pg_partitioned_table WHERE partrelid = %s::regclass)",
+        (f"{SCHEMA}.{table_name}",),
+    )
+    if cursor.fetchone()[0]:
+        _create_year_partitions(cursor, table_name)
+
+
+def _get_index_columns(cursor, index_name: str) -> list[str] | None:
+    """Helper to get the columns of an index in order, or None if it doesn't exist."""
+    cursor.execute(
+        "SELECT array_agg(a.attname::text ORDER BY k.position)"
+        " FROM pg_index i"
+        " CROSS JOIN unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, position)"
+        " JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum"
+        " WHERE i.indexrelid = to_regclass(%s)",
+        (f"{SCHEMA}.{index_name}",),
+    )
+    return cursor.fetchone()[0]
+
+
+def _create_year_partitions(cursor, table_name: str) -> None:
+    """Helper to add the missing year partitions of a partitioned table."""
+    from psycopg2 import sql
+
+    table = sql.Identifier(SCHEMA, table_name)
+    for year in range(FIRST_PARTITION_YEAR, dt.date.today().year + 2):
+        cursor.execute(
+            sql.SQL(
+                "CREATE TABLE IF NOT EXISTS {} PARTITION OF {}"
+                " FOR VALUES FROM (%s) TO (%s)"
+            ).format(sql.Identifier(SCHEMA, f"{table_name}_{year}"), table),
+            (dt.date(year, 1, 1), dt.date(year + 1, 1, 1)),
+        )
+    cursor.execute(
+        sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} DEFAULT").format(
+            sql.Identifier(SCHEMA, f"{table_name}_default"), table
+        )
+    )
+
+
+def get_sync_state(table_name: str) -> dict | None:
+    """
+    Get the Delta table version a table was last synced to by `copy_to_postgres`.
+
+    Returns None when the table hasn't been synced.
+    """
+    from psycopg2 import sql
+
+    pool = get_postgres_pool()
+    connection = pool.getconn()
+    try:
+        with connection, connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", (f"{SCHEMA}.{SYNC_STATE_TABLE}",))
+            if cursor.fetchone()[0] is None:
+                return None
+            cursor.execute(
+                sql.SQL(
+                    "SELECT table_id, delta_version FROM {} WHERE table_name = %s"
+                ).format(sql.Identifier(SCHEMA, SYNC_STATE_TABLE)),
+                (table_name,),
+            )
+            row = cursor.fetchone()
+    finally:
+        pool.putconn(connection)
+
+    if row is None:
+        return None
+    return {"table_id": row[0], "version": row[1]}
+
+
+def _copy_batches(
+    cursor,
+    batches: Iterable[pa.RecordBatch],
+    schema: pa.Schema,
+    table_name: str,
+    primary_key: list[str],
+    write_disposition: str,
+    rebuild_indexes: bool,
+    partition: str | None,
+) -> int:
+    """Helper to copy record batches into a table within the cursor's transaction."""
+    from psycopg2 import sql
+
+    table = sql.Identifier(SCHEMA, table_name)
+    staging_table = sql.Identifier(SCHEMA, f"_copy_staging_{table_name}")
+    index_name = f"{table_name}_primary_key_idx"
+    columns = schema.names
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    key_list = sql.SQL(", ").join(map(sql.Identifier, primary_key))
+    updates = [column for column in columns if column not in primary_key]
+
+    _create_table(cursor, table_name, schema, primary_key, partition)
+    cursor.execute(
+        sql.SQL(
+            "DROP TABLE IF EXISTS {staging};"
+            "CREATE UNLOGGED TABLE {staging} AS"
+            " SELECT {columns} FROM {table} WITH NO DATA"
+        ).format(staging=staging_table, columns=column_list, table=table)
+    )
+
+    copy_statement = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)")
+    copy_statement = copy_statement.format(staging_table, column_list)
+    rows = 0
+    for batch in batches:
+        buffer = io.BytesIO()
+        pa_csv.write_csv(
+            batch.select(columns),
+            buffer,
+            pa_csv.WriteOptions(include_header=False),
+        )
+        buffer.seek(0)
+        cursor.copy_expert(copy_statement.as_string(cursor), buffer)
+        rows += batch.num_rows
+
+    if write_disposition == "replace":
+        cursor.execute(sql.SQL("TRUNCATE {}").format(table))
+
+    index_definitions = []
+    if rebuild_indexes:
+        index_definitions = _drop_indexes(cursor, table_name, index_name)
+
+    if updates:
+        conflict_action = sql.SQL("DO UPDATE SET {}").format(
+            sql.SQL(", ").join(
+                sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(column))
+                for column in updates
+            )
+        )
+    else:
+        conflict_action = sql.SQL("DO NOTHING")
+    cursor.execute(
+        sql.SQL(
+            "INSERT INTO {table} ({columns})"
+            " SELECT DISTINCT ON ({key}) {columns} FROM {staging}"
+            " ON CONFLICT ({key}) {action}"
+        ).format(
+            table=table,
+            columns=column_list,
+            key=key_list,
+            staging=staging_table,
+            action=conflict_action,
+        )
+    )
+
+    for index_definition in index_definitions:
+        cursor.execute(index_definition)
+    cursor.execute(sql.SQL("DROP TABLE {}").format(staging_table))
+
+    return rows
+
+
+def _set_sync_state(cursor, table_name: str, sync_state: dict) -> None:
+    """Helper to store the sync state of a table within the cursor's transaction."""
+    from psycopg2 import sql
+
+    sync_state_table = sql.Identifier(SCHEMA, SYNC_STATE_TABLE)
+    cursor.execute(
+        sql.SQL(
+            "CREATE TABLE IF NOT EXISTS {} (table_name varchar PRIMARY KEY,"
+            " table_id varchar NOT NULL, delta_version bigint NOT NULL,"
+            " synced_at timestamp with time zone NOT NULL)"
+        ).format(sync_state_table)
+    )
+    cursor.execute(
+        sql.SQL(
+            "INSERT INTO {} VALUES (%s, %s, %s, now()) ON CONFLICT (table_name)"
+            " DO UPDATE SET table_id = EXCLUDED.table_id,"
+            " delta_version = EXCLUDED.delta_version, synced_at = EXCLUDED.synced_at"
+        ).format(sync_state_table),
+        (table_name, sync_state["table_id"], sync_state["version"]),
+    )
+
+
+@thread_safe_cache
+def get_postgres_pool():
+    """Return the process wide pool of connections to the data warehouse."""
+    from psycopg2.pool import ThreadedConnectionPool
+
+    settings = get_settings()
+    return ThreadedConnectionPool(
+        minconn=1,
+        maxconn=4,
+        host=settings.db_host,
+        port=settings.db_port,
+        user=settings.db_user,
+        password=settings.db_password,
+        dbname=settings.db_name,
+    )
+
+
+def get_postgres_type(arrow_type: pa.DataType) -> str:
+    """Get the Postgres type dlt uses for columns of an arrow type."""
+    if (
+        pa.types.is_string(arrow_type)
+        or pa.types.is_large_string(arrow_type)
+        or pa.types.is_string_view(arrow_type)
+    ):
+        return "varchar"
+    elif pa.types.is_boolean(arrow_type):
+        return "boolean"
+    elif pa.types.is_integer(arrow_type):
+        return "bigint"
+    elif pa.types.is_floating(arrow_type):
+        return "double precision"
+    elif pa.types.is_date(arrow_type):
+        return "date"
+    elif pa.types.is_timestamp(arrow_type):
+        return "timestamp with time zone"
+    else:
+        raise ValueError(f"Unknown column type: {arrow_type}")
+
+
+def _to_batches(
+    data: pd.DataFrame | pa.Table | Iterable[pa.RecordBatch],
+) -> Iterator[pa.RecordBatch]:
+    if isinstance(data, pd.DataFrame):
+        data = pa.Table.from_pandas(data, preserve_index=False)
+    if isinstance(data, pa.Table):
+        return iter(data.to_batches())
+    return iter(data)
+
+
+def _drop_indexes(cursor, table_name: str, keep_index: str) -> list[str]:
+    """Drop the indexes of a table other than `keep_index` and return their DDL."""
+    from psycopg2 import sql
+
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes"
+        " WHERE schemaname = %s AND tablename = %s AND indexname <> %s"
+        " AND NOT EXISTS (SELECT FROM pg_constraint WHERE conname = indexname)",
+        (SCHEMA, table_name, keep_index),
+    )
+    indexes = cursor.fetchall()
+    for index_name, _ in indexes:
+        cursor.execute(
+            sql.SQL("DROP INDEX {}").format(sql.Identifier(SCHEMA, index_name))
+        )
+    return [index_definition for _, index_definition in indexes]
@@ -1,35 +1,44 @@
 import datetime as dt
+import numpy as np
 import pandas as pd
 from py_pipeline.validate import (
     raw_stock_symbols_schema,
     raw_fx_symbols_schema,
     raw_price_schema,
+    validate_df,
 )
 
+# FX tickers quoted against USD that are stored under their full pair name
+FX_PRICE_SYMBOLS = {"CHF": "USDCHF", "CAD": "USDCAD", "JPY": "USDJPY"}
+
 
 def transform(
     df: pd.DataFrame,
     dataset: str,
     asset_category: str,
+    validation_mode: str = "full",
     **kwargs,
 ) -> pd.DataFrame:
     if dataset == "symbols":
         if asset_category == "sp_stocks":
-            return transform_stocks_symbol_df(df, **kwargs)
+            return transform_stocks_symbol_df(
+                df, validation_mode=validation_mode, **kwargs
+            )
         elif asset_category == "fx":
-            return transform_fx_symbol_df(df)
+            return transform_fx_symbol_df(df, validation_mode)
         else:
             raise ValueError(f"Unknown asset category: {asset_category}")
     elif dataset == "price_history":
-        return transform_price_df(df, asset_category)
+        return transform_price_df(df, asset_category, validation_mode)
     else:
         raise ValueError(f"Unknown dataset: {dataset}")
 
 
 def transform_stocks_symbol_df(
-    df: pd.DataFrame, date_stamp: str | dt.date
+    df: pd.DataFrame, date_stamp: str | dt.date, validation_mode: str = "full"
 ) -> pd.DataFrame:
-    df = raw_stock_symbols_schema.validate(df, lazy=True).reset_index(drop=True)
+    df = validate_df(df, raw_stock_symbols_schema, validation_mode)
+    df = df.reset_index(drop=True)
     df.columns = df.columns.str.lower()
     df.rename(
         columns={
@@ -63,28 +72,82 @@ def transform_stocks_symbol_df(
     return df[cols]
 
 
-def transform_fx_symbol_df(df: pd.DataFrame) -> pd.DataFrame:
-    df = raw_fx_symbols_schema.validate(df, lazy=True)
+def transform_fx_symbol_df(
+    df: pd.DataFrame, validation_mode: str = "full"
+) -> pd.DataFrame:
+    df = validate_df(df, raw_fx_symbols_schema, validation_mode)
     df.columns = df.columns.str.lower()
     return df
 
 
-def transform_price_df(df: pd.DataFrame, asset_category: str) -> pd.DataFrame:
+def diff_symbols(df: pd.DataFrame, latest_df: pd.DataFrame | None) -> dict[str, int]:
+    """
+    Count the rows added to and removed from the latest symbols snapshot.
+
+    Rows are compared by a hash of their columns other than date_stamp, so a
+    snapshot with the same symbols taken on another day has no changes. A symbol
+    whose details changed counts as one row removed and one row added.
+    """
+    columns = [column for column in df.columns if column != "date_stamp"]
+    hashes = set(pd.util.hash_pandas_object(df[columns], index=False))
+    if latest_df is None or not set(columns).issubset(latest_df.columns):
+        latest_hashes = set()
+    else:
+        latest_hashes = set(pd.util.hash_pandas_object(latest_df[columns], index=False))
+
+    return {
+        "added": len(hashes - latest_hashes),
+        "removed": len(latest_hashes - hashes),
+    }
+
+
+def transform_price_df(
+    df: pd.DataFrame, asset_category: str, validation_mode: str = "full"
+) -> pd.DataFrame:
+    """
+    Reshape wide source prices into one row per date and symbol.
+
+    Rows are built from the raveled price columns of all tickers at once, with
+    dates repeated and symbols mapped once per ticker and tiled, instead of
+    stacking the frame's column index.
+    """
     if df.empty:
         return df
 
-    df = raw_price_schema.validate(df, lazy=True)
-    cols_without_data = df.columns[df.isna().sum() == df.shape[0]]
+    df = validate_df(df, raw_price_schema, validation_mode)
+    df = df.loc[:, df.notna().any()]
 
-    df = df.drop(cols_without_data, axis=1)
-    df = df.stack("Ticker", future_stack=True).reset_index()
-    df.columns = df.columns.str.lower().rename(None)
-    df["date"] = df["date"].dt.date
-    df.rename(columns={"ticker": "symbol", "date": "date_stamp"}, inplace=True)
-    if asset_category == "fx":
-        df["symbol"] = (
-            df["symbol"]
-            .str.replace("=X", "")
-            .replace({"CHF": "USDCHF", "CAD": "USDCAD", "JPY": "USDJPY"})
+    prices = df.columns.unique("Price")
+    tickers = df.columns.unique("Ticker")
+    symbols = get_price_symbols(pd.Series(tickers, dtype="str"), asset_category)
+
+    long_df = pd.DataFrame(
+        {
+            "date_stamp": np.repeat(df.index.date, len(tickers)),
+            "symbol": pd.array(np.tile(symbols.to_numpy(), len(df.index)), "str"),
+        }
+    )
+    for price in prices:
+        columns = pd.MultiIndex.from_product([[price], tickers], names=df.columns.names)
+        long_df[price.lower()] = _ravel_rows(df.reindex(columns=columns))
+
+    if "volume" in long_df:  # Not coerced by the raw schema when validation is skipped
+        long_df["volume"] = long_df["volume"].astype("Int64")
+    return long_df
+
+
+def _ravel_rows(df: pd.DataFrame) -> np.ndarray | pd.api.extensions.ExtensionArray:
+    """Flatten a frame row by row, keeping nullable integer columns nullable."""
+    if isinstance(df.dtypes.iloc[0], pd.Int64Dtype):
+        return pd.arrays.IntegerArray(
+            df.to_numpy(dtype="int64", na_value=0).ravel(),
+            df.isna().to_numpy().ravel(),
         )
-    return df
+    return df.to_numpy(dtype="float64", na_value=np.nan).ravel()
+
+
+def get_price_symbols(symbols: pd.Series, asset_category: str) -> pd.Series:
+    """Map source ticker symbols to the symbols stored with the price history."""
+    if asset_category == "fx":
+        return symbols.str.replace("=X", "").replace(FX_PRICE_SYMBOLS)
+    return symbols
@@ -0,0 +1,133 @@
+import datetime as dt
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from py_pipeline.cache import PriceCache
+
+PRICE_COLUMNS = ["Close", "High", "Low", "Open", "Volume"]
+
+
+def fake_bars(symbols: list[str], start: dt.date, end: dt.date) -> pd.DataFrame:
+    """Create wide daily bars shaped like a yfinance download."""
+    index = pd.date_range(start, end, inclusive="left", name="Date", unit="ns")
+    columns = pd.MultiIndex.from_product(
+        [PRICE_COLUMNS, symbols], names=["Price", "Ticker"]
+    )
+    values = [[float(day.day)] * len(columns) for day in index]
+    return pd.DataFrame(values, index=index, columns=columns)
+
+
+class FakeDownloader:
+    def __init__(self, failed_symbols: list[str] | None = None):
+        self.calls = []
+        self.failed_symbols = failed_symbols or []
+
+    def __call__(self, symbols, start, end):
+        self.calls.append((sorted(symbols), start, end))
+        bars = fake_bars(symbols, start, end)
+        for symbol in self.failed_symbols:
+            if symbol in symbols:
+                bars.loc[:, (slice(None), symbol)] = float("nan")
+        return bars
+
+
+@pytest.fixture
+def price_cache(tmp_path):
+    return PriceCache(tmp_path.joinpath("prices"))
+
+
+def test_get_prices_serves_cached_bars(price_cache):
+    download = FakeDownloader()
+    symbols = ["AAPL", "MSFT"]
+    start, end = dt.date(2025, 1, 1), dt.date(2025, 1, 10)
+
+    first = price_cache.get_prices(symbols, start, end, download)
+    second = price_cache.get_prices(symbols, start, end, download)
+
+    assert len(download.calls) == 1
+    pd.testing.assert_frame_equal(first, second)
+    pd.testing.assert_frame_equal(
+        second, fake_bars(symbols, start, end), check_freq=False
+    )
+
+
+def test_get_prices_downloads_missing_ranges_only(price_cache):
+    download = FakeDownloader()
+    price_cache.get_prices(
+        ["AAPL"], dt.date(2025, 1, 5), dt.date(2025, 1, 10), download
+    )
+    download.calls.clear()
+
+    bars = price_cache.get_prices(
+        ["AAPL", "MSFT"], dt.date(2025, 1, 1), dt.date(2025, 1, 15), download
+    )
+
+    assert sorted(download.calls) == [
+        (["AAPL"], dt.date(2025, 1, 1), dt.date(2025, 1, 5)),
+        (["AAPL"], dt.date(2025, 1, 10), dt.date(2025, 1, 15)),
+        (["MSFT"], dt.date(2025, 1, 1), dt.date(2025, 1, 15)),
+    ]
+    pd.testing.assert_frame_equal(
+        bars,
+        fake_bars(["AAPL", "MSFT"], dt.date(2025, 1, 1), dt.date(2025, 1, 15)),
+        check_freq=False,
+    )
+
+
+def test_get_prices_does_not_cache_failed_symbols(price_cache):
+    download = FakeDownloader(failed_symbols=["INVALID"])
+    start, end = dt.date(2025, 1, 1), dt.date(2025, 1, 10)
+
+    price_cache.get_prices(["AAPL", "INVALID"], start, end, download)
+    price_cache.get_prices(["AAPL", "INVALID"], start, end, download)
+
+    assert download.calls[-1] == (["INVALID"], start, end)
+
+
+def test_get_prices_ignores_expired_entries(tmp_path):
+    price_cache = PriceCache(tmp_path, ttl=dt.timedelta(0))
+    download = FakeDownloader()
+    start, end = dt.date(2025, 1, 1), dt.date(2025, 1, 10)
+
+    price_cache.get_prices(["AAPL"], start, end, download)
+    price_cache.get_prices(["AAPL"], start, end, download)
+
+    assert len(download.calls) == 2
+
+
+def test_get_prices_evicts_least_recently_used_entries(tmp_path):
+    price_cache = PriceCache(tmp_path, max_bytes=0)
+    download = FakeDownloader()
+    start, end = dt.date(2025, 1, 1), dt.date(2025, 1, 10)
+
+    bars = price_cache.get_prices(["AAPL"], start, end, download)
+
+    assert not bars.empty
+    assert list(tmp_path.glob("*.parquet")) == []
+
+
+def test_get_prices_downloads_concurrently(price_cache):
+    download = FakeDownloader()
+    both_downloading = threading.Barrier(2, timeout=5)
+
+    def wait_for_other_download(symbols, start, end):
+        both_downloading.wait()  # Times out if the downloads are serialized
+        return download(symbols, start, end)
+
+    start, end = dt.date(2025, 1, 1), dt.date(2025, 1, 10)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [
+            executor.submit(
+                price_cache.get_prices, [symbol], start, end, wait_for_other_download
+            )
+            for symbol in ("AAPL", "MSFT")
+        ]
+    for future in futures:
+        assert not future.result().empty
+
+    price_cache.get_prices(["AAPL", "MSFT"], start, end, download)
+
+    assert len(download.calls) == 2
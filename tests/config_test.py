@@ -0,0 +1,126 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from prefect_aws import AwsCredentials
+from prefect.blocks.system import Secret
+
+from py_pipeline.config import Settings, get_settings, thread_safe_cache
+
+ENV_CREDENTIALS = {
+    "AWS_ACCESS_KEY": "test_access_key",
+    "AWS_SECRET_KEY": "test_secret_key",
+    "DB_USER": "test_user",
+    "DB_PASSWORD": "test_password",
+    "DB_HOST": "test_host",
+    "DB_PORT": "5432",
+}
+
+
+@pytest.fixture
+def env_credentials(monkeypatch):
+    for name, value in ENV_CREDENTIALS.items():
+        monkeypatch.setenv(name, value)
+
+
+def _fail_block_load(*args, **kwargs):
+    raise AssertionError("Prefect blocks should not be loaded")
+
+
+def test_settings_from_env_does_not_load_prefect_blocks(monkeypatch, env_credentials):
+    monkeypatch.setattr(AwsCredentials, "load", _fail_block_load)
+    monkeypatch.setattr(Secret, "load", _fail_block_load)
+
+    settings = Settings(credentials_source="env")
+
+    assert settings.aws_access_key == ENV_CREDENTIALS["AWS_ACCESS_KEY"]
+    assert settings.aws_secret_key == ENV_CREDENTIALS["AWS_SECRET_KEY"]
+    assert settings.db_user == ENV_CREDENTIALS["DB_USER"]
+    assert settings.db_password == ENV_CREDENTIALS["DB_PASSWORD"]
+    assert settings.db_host == ENV_CREDENTIALS["DB_HOST"]
+    assert settings.db_port == ENV_CREDENTIALS["DB_PORT"]
+
+
+def test_settings_resolve_credentials_once(monkeypatch, env_credentials):
+    settings = Settings(credentials_source="env")
+    assert settings.aws_access_key == ENV_CREDENTIALS["AWS_ACCESS_KEY"]
+
+    monkeypatch.setenv("AWS_ACCESS_KEY", "rotated_access_key")
+
+    assert settings.aws_access_key == ENV_CREDENTIALS["AWS_ACCESS_KEY"]
+
+
+def test_get_settings_returns_cached_settings():
+    assert get_settings() is get_settings()
+
+
+def test_settings_raises_on_unknown_credentials_source():
+    with pytest.raises(ValueError):
+        Settings(credentials_source="vault")
+
+
+def test_settings_local_data_path_needs_no_credentials(monkeypatch, tmp_path):
+    monkeypatch.setenv("DATA_PATH", str(tmp_path))
+    monkeypatch.setattr(AwsCredentials, "load", _fail_block_load)
+
+    settings = Settings()
+
+    assert settings.data_path == tmp_path.as_uri()
+    assert settings.storage_backend == "local"
+    assert settings.delta_storage_options == {}
+
+
+def test_settings_default_data_path_is_s3_bucket(monkeypatch):
+    monkeypatch.delenv("DATA_PATH", raising=False)
+    monkeypatch.setenv("BUCKET_NAME", "test-bucket")
+
+    settings = Settings()
+
+    assert settings.data_path == "s3://test-bucket"
+    assert settings.storage_backend == "s3"
+
+
+def test_settings_raises_on_unknown_data_path_scheme(monkeypatch):
+    monkeypatch.setenv("DATA_PATH", "memory://securities-data-lake")
+
+    with pytest.raises(ValueError):
+        Settings().storage_backend
+
+
+def test_settings_raises_on_unknown_dw_loader(monkeypatch):
+    monkeypatch.setenv("DW_LOADER", "bulk")
+
+    with pytest.raises(ValueError):
+        Settings().dw_loader
+
+
+@pytest.mark.parametrize("db_type, threads", (("postgres", 4), ("snowflake", 8)))
+def test_settings_dbt_threads_default_to_database_type(monkeypatch, db_type, threads):
+    monkeypatch.delenv("DBT_THREADS", raising=False)
+    monkeypatch.setenv("DB_TYPE", db_type)
+
+    assert Settings().dbt_threads == threads
+
+    monkeypatch.setenv("DBT_THREADS", "16")
+
+    assert Settings().dbt_threads == 16
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
+
+
+def test_thread_safe_cache_builds_one_instance_across_threads():
+    calls = []
+
+    @thread_safe_cache
+    def factory():
+        calls.append(None)
+        time.sleep(0.05)  # Leave time for the other threads to miss the cache
+        return object()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        instances = list(executor.map(lambda _: factory(), range(4)))
+
+    assert len(calls) == 1
+    assert all(instance is instances[0] for instance in instances)
@@ -48,6 +48,11 @@ def drop_dw_tables():
         for asset_category in ("fx", "sp_stocks"):
             con.execute(text(f"DROP TABLE IF EXISTS symbols_{asset_category};"))
             con.execute(text(f"DROP TABLE IF EXISTS price_history_{asset_category};"))
-        for table in ["_dlt_loads", "_dlt_pipeline_state", "_dlt_version"]:
+        for table in [
+            "_dlt_loads",
+            "_dlt_pipeline_state",
+            "_dlt_version",
+            "_delta_sync_state",
+        ]:
             con.execute(text(f"DROP TABLE IF EXISTS {table};"))
         con.commit()
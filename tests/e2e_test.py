@@ -1,3 +1,4 @@
+import datetime as dt
 from pathlib import Path
 
 import pandas as pd
@@ -17,9 +18,16 @@ from py_pipeline.config import (
     DB_PASSWORD,
     DB_NAME,
 )
+from py_pipeline import metrics, orchestration
 from py_pipeline.extract import YF_ERRORS
+from py_pipeline.metrics import get_metrics, measure
 from py_pipeline.orchestration import (
+    dbt_packages_installed,
+    etl_flow,
     etl_price_history_source_to_s3,
+    get_dbt_select_args,
+    group_symbols_by_start_date,
+    multi_asset_etl_flow,
     etl_symbols_source_to_s3,
     el_symbols_s3_to_dw,
     el_price_history_s3_to_dw,
@@ -333,6 +341,262 @@ def test_s3_etl_bars_in_chunk(
         assert_loaded_data_matches_expected(loaded_data, expected_data)
 
 
+@pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
+def test_s3_etl_bars_in_concurrent_chunks(
+    monkeypatch, price_data, asset_category, remove_s3_objects
+):
+    monkeypatch.setattr(
+        "py_pipeline.extract.yf.download",
+        lambda *args, **kwargs: price_data(asset_category, *args),
+    )
+
+    symbols = [
+        symbol
+        for symbol in (FX_SYMBOLS if asset_category == "fx" else SP_SYMBOLS)
+        if not symbol.startswith("INVALID")
+    ]
+    etl_price_history_source_to_s3(
+        asset_category, symbols, "2000-01-01", "2000-01-05", chunk_size=2, max_workers=3
+    )
+
+    loaded_data = DeltaTable(
+        f"{DATA_PATH}/price_history/{asset_category}",
+        storage_options=s3_storage_options,
+    ).to_pandas()
+    expected_data = pd.read_parquet(
+        TEST_DATA_DIR.joinpath(f"processed_{asset_category}_prices.parquet"),
+    )
+
+    assert_loaded_data_matches_expected(loaded_data, expected_data)
+
+
+@pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
+def test_s3_etl_bars_in_chunk_collects_failed_chunks(monkeypatch, asset_category):
+    def download(symbols, *args, **kwargs):
+        if "FAILING_SYMBOL" in symbols:
+            raise ConnectionError("Source unavailable")
+        return pd.DataFrame()
+
+    symbols = ["PLACE_HOLDER_1", "FAILING_SYMBOL", "PLACE_HOLDER_2", "PLACE_HOLDER_3"]
+    monkeypatch.setattr("py_pipeline.extract.yf.download", download)
+    monkeypatch.setitem(YF_ERRORS, asset_category, [])
+
+    with pytest.raises(RuntimeError, match="FAILING_SYMBOL") as exc_info:
+        etl_price_history_source_to_s3(
+            asset_category, symbols, "2000-01-01", "2000-01-05", chunk_size=1, max_workers=2
+        )
+
+    assert isinstance(exc_info.value.__cause__, ConnectionError)
+
+
+@pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
+def test_s3_etl_bars_incremental(
+    monkeypatch, price_data, asset_category, remove_s3_objects
+):
+    downloads = []
+
+    def download(symbols, start, end, **kwargs):
+        downloads.append((sorted(symbols), str(start)))
+        return price_data(asset_category, symbols, str(start), str(end))
+
+    monkeypatch.setattr("py_pipeline.extract.yf.download", download)
+    symbols = [
+        symbol
+        for symbol in (FX_SYMBOLS if asset_category == "fx" else SP_SYMBOLS)
+        if not symbol.startswith("INVALID")
+    ]
+
+    # Load the first days for all symbols except one
+    etl_price_history_source_to_s3(
+        asset_category, symbols[1:], "2000-01-03", "2000-01-05", incremental=True
+    )
+    downloads.clear()
+
+    etl_price_history_source_to_s3(
+        asset_category, symbols, "2000-01-03", "2000-01-07", incremental=True
+    )
+
+    loaded_data = DeltaTable(
+        f"{DATA_PATH}/price_history/{asset_category}",
+        storage_options=s3_storage_options,
+    ).to_pandas()
+
+    assert sorted(downloads) == sorted(
+        [(sorted(symbols[1:]), "2000-01-06"), ([symbols[0]], "2000-01-03")]
+    )
+    assert loaded_data["date_stamp"].max() == pd.Timestamp("2000-01-07").date()
+
+
+def test_group_symbols_by_start_date():
+    watermarks = {
+        "AAPL": pd.Timestamp("2000-01-04").date(),
+        "MSFT": pd.Timestamp("2000-01-04").date(),
+        "BRK-B": pd.Timestamp("2000-01-06").date(),
+    }
+
+    groups = group_symbols_by_start_date(
+        ["AAPL", "MSFT", "BRK-A", "BRK-B"], watermarks, "2000-01-03", "2000-01-07"
+    )
+
+    assert groups == {
+        pd.Timestamp("2000-01-05").date(): ["AAPL", "MSFT"],
+        pd.Timestamp("2000-01-03").date(): ["BRK-A"],
+    }
+
+
+def test_incremental_etl_flow_without_dates_loads_days_missed(monkeypatch):
+    today = dt.date.today()
+    runs = []
+
+    def record_run(name):
+        def run(*args, **kwargs):
+            runs.append((name, kwargs["start_date"]))
+            return kwargs["start_date"]
+
+        return run
+
+    for subflow in (
+        "etl_price_history_source_to_s3",
+        "el_symbols_s3_to_dw",
+        "el_price_history_s3_to_dw",
+    ):
+        monkeypatch.setattr(orchestration, subflow, record_run(subflow))
+    monkeypatch.setattr(
+        orchestration,
+        "get_price_watermarks_from_s3",
+        lambda asset_category, symbols: {
+            "AAPL": today - dt.timedelta(days=5),
+            "MSFT": today - dt.timedelta(days=2),
+        },
+    )
+
+    etl_flow("sp_stocks", symbols=["AAPL", "MSFT"], incremental=True)
+
+    assert runs == [
+        ("etl_price_history_source_to_s3", today - dt.timedelta(days=4)),
+        ("el_symbols_s3_to_dw", today - dt.timedelta(days=4)),
+        ("el_price_history_s3_to_dw", today - dt.timedelta(days=4)),
+    ]
+
+
+def test_incremental_etl_flow_without_dates_syncs_days_loaded(monkeypatch):
+    today = dt.date.today()
+    dw_runs = []
+    loaded_chunks = []
+
+    def load_chunk(asset_category, symbols, start_date, **kwargs):
+        # The stale symbol keeps failing, so only MSFT is loaded
+        if symbols == ["STALE"]:
+            YF_ERRORS[asset_category].append("STALE")
+            return False
+        loaded_chunks.append((symbols, start_date))
+        return True
+
+    for subflow in ("el_symbols_s3_to_dw", "el_price_history_s3_to_dw"):
+        monkeypatch.setattr(
+            orchestration,
+            subflow,
+            lambda name=subflow, **kwargs: dw_runs.append((name, kwargs["start_date"])),
+        )
+    monkeypatch.setattr(
+        orchestration, "_etl_price_history_chunk_source_to_s3", load_chunk
+    )
+    monkeypatch.setattr(
+        orchestration,
+        "get_price_watermarks_from_s3",
+        lambda asset_category, symbols: {
+            "STALE": today - dt.timedelta(days=30),
+            "MSFT": today - dt.timedelta(days=3),
+        },
+    )
+    monkeypatch.setitem(YF_ERRORS, "sp_stocks", [])
+
+    with pytest.raises(RuntimeError, match="STALE"):
+        etl_flow("sp_stocks", symbols=["STALE", "MSFT"], incremental=True)
+
+    assert loaded_chunks == [(["MSFT"], today - dt.timedelta(days=2))]
+    assert dw_runs == [
+        ("el_symbols_s3_to_dw", today - dt.timedelta(days=2)),
+        ("el_price_history_s3_to_dw", today - dt.timedelta(days=2)),
+    ]
+
+
+def test_multi_asset_etl_flow_runs_dbt_after_all_asset_categories(monkeypatch):
+    etl_runs, dbt_runs = [], []
+
+    def etl_flow(asset_category, **kwargs):
+        etl_runs.append(asset_category)
+        if asset_category == "fx":
+            raise RuntimeError("Failed to get data for some symbols")
+
+    monkeypatch.setattr(orchestration, "etl_flow", etl_flow)
+    monkeypatch.setattr(
+        orchestration,
+        "dbt_runner",
+        lambda asset_categories: dbt_runs.append((list(etl_runs), asset_categories)),
+    )
+
+    with pytest.raises(RuntimeError, match="ETL failed for fx"):
+        multi_asset_etl_flow(["fx", "sp_stocks"])
+
+    assert sorted(etl_runs) == ["fx", "sp_stocks"]
+    assert len(dbt_runs) == 1
+    assert sorted(dbt_runs[0][0]) == ["fx", "sp_stocks"]
+    assert dbt_runs[0][1] == ["fx", "sp_stocks"]
+
+
+def test_multi_asset_etl_flow_publishes_stage_metrics_of_each_asset_category(
+    monkeypatch,
+):
+    def validate(*args, **kwargs):
+        with measure("validate", schema="price_history", mode="full"):
+            pass
+
+    for subflow in (
+        "etl_symbols_source_to_s3",
+        "etl_price_history_source_to_s3",
+        "el_symbols_s3_to_dw",
+        "el_price_history_s3_to_dw",
+    ):
+        monkeypatch.setattr(orchestration, subflow, validate)
+    monkeypatch.setattr(orchestration, "extract_task", lambda **kwargs: ["AAPL"])
+    get_metrics(clear=True)
+
+    multi_asset_etl_flow(["fx", "sp_stocks"], run_dbt=False)
+
+    assert metrics._RECORDS == []
+
+
+def test_get_dbt_select_args(tmp_path):
+    assert get_dbt_select_args() == []
+    assert get_dbt_select_args(["fx"], str(tmp_path)) == [
+        "--select",
+        "source:raw.symbols_fx+",
+        "source:raw.price_history_fx+",
+    ]
+
+    tmp_path.joinpath("manifest.json").write_text("{}")
+
+    assert get_dbt_select_args(["fx"], str(tmp_path)) == [
+        "--select",
+        "source:raw.symbols_fx+",
+        "source:raw.price_history_fx+",
+        "state:modified+",
+        "--state",
+        str(tmp_path),
+    ]
+
+
+def test_dbt_packages_installed(tmp_path):
+    tmp_path.joinpath("package-lock.yml").write_text(
+        "packages:\n  - name: dbt_utils\n    package: dbt-labs/dbt_utils\n"
+    )
+    assert not dbt_packages_installed(tmp_path)
+
+    tmp_path.joinpath("dbt_packages", "dbt_utils").mkdir(parents=True)
+    assert dbt_packages_installed(tmp_path)
+
+
 @pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
 def test_s3_etl_bars_raises_exception(monkeypatch, asset_category):
     """
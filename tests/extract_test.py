@@ -1,6 +1,9 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pandas as pd
+import pyarrow as pa
 import pytest
 from minio import Minio
 from deltalake import write_deltalake
@@ -163,6 +166,70 @@ def test_get_prices_from_s3_by_date(asset_category):
     assert price_df.columns.tolist() == expected_data.columns.tolist()
 
 
+@pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
+def test_get_prices_from_s3_by_symbols(asset_category):
+    expected_data = pd.read_parquet(
+        TEST_DATA_DIR.joinpath(f"processed_{asset_category}_prices.parquet")
+    )
+    symbols = expected_data["symbol"].unique().tolist()[:2]
+    expected_data = expected_data.loc[expected_data["symbol"].isin(symbols)]
+
+    price_df = get_prices_from_s3(asset_category, symbols=symbols)
+
+    assert price_df.shape == expected_data.shape
+    assert set(price_df["symbol"]) == set(symbols)
+
+
+@pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
+def test_get_prices_from_s3_as_arrow(asset_category):
+    expected_data = pd.read_parquet(
+        TEST_DATA_DIR.joinpath(f"processed_{asset_category}_prices.parquet"),
+    )
+
+    price_table = get_prices_from_s3(asset_category, as_arrow=True)
+
+    assert isinstance(price_table, pa.Table)
+    assert price_table.shape == expected_data.shape
+    assert price_table.column_names == expected_data.columns.tolist()
+
+
+@pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
+def test_get_prices_from_s3_in_batches(asset_category):
+    start_date = pd.Timestamp("2000-01-03").date()
+    end_date = pd.Timestamp("2000-01-06").date()
+
+    expected_data = pd.read_parquet(
+        TEST_DATA_DIR.joinpath(f"processed_{asset_category}_prices.parquet")
+    )
+    mask = (expected_data["date_stamp"] >= start_date) & (
+        expected_data["date_stamp"] <= end_date
+    )
+    expected_data = expected_data.loc[mask].reset_index(drop=True)
+
+    batches = list(
+        get_prices_from_s3(
+            asset_category, start_date=start_date, end_date=end_date, batch_rows=3
+        )
+    )
+
+    assert all(0 < batch.num_rows <= 3 for batch in batches)
+    assert sum(batch.num_rows for batch in batches) == len(expected_data)
+
+
+@pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
+def test_get_symbols_data_from_s3_as_arrow(asset_category):
+    expected_data = pd.read_parquet(
+        TEST_DATA_DIR.joinpath(f"processed_{asset_category}_symbols.parquet")
+    )
+
+    symbols_table = get_symbols_from_s3(
+        asset_category, symbols_only=False, as_arrow=True
+    )
+
+    assert isinstance(symbols_table, pa.Table)
+    assert symbols_table.shape == expected_data.shape
+
+
 @pytest.mark.parametrize(
     ("asset_category", "symbols"),
     (
@@ -185,5 +252,33 @@ def test_log_failed_downloads(monkeypatch, asset_category, symbols):
     assert YF_ERRORS[asset_category] == list(yf.shared._ERRORS.keys())
 
 
+def test_log_failed_downloads_of_concurrent_downloads(monkeypatch):
+    def download(symbols, start, end, auto_adjust):
+        monkeypatch.setattr(yf.shared, "_ERRORS", {symbols[0]: "Error message"})
+
+    monkeypatch.setattr(yf, "download", download)
+    monkeypatch.setitem(YF_ERRORS, "fx", [])
+    monkeypatch.setitem(YF_ERRORS, "sp_stocks", [])
+    both_downloaded = threading.Barrier(2, timeout=5)
+
+    def extract(asset_category, symbols):
+        get_prices_from_source(symbols)
+        both_downloaded.wait()
+        log_failed_dowloads(asset_category)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [
+            executor.submit(extract, "fx", ["INVALID_FX_SYMBOL"]),
+            executor.submit(extract, "sp_stocks", ["INVALID_STOCK_SYMBOL"]),
+        ]
+    for future in futures:
+        future.result()
+
+    assert YF_ERRORS == {
+        "fx": ["INVALID_FX_SYMBOL"],
+        "sp_stocks": ["INVALID_STOCK_SYMBOL"],
+    }
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -0,0 +1,242 @@
+import asyncio
+import datetime as dt
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pandas as pd
+import pytest
+
+from py_pipeline.cache import PageTableCache
+from py_pipeline.fetcher import (
+    AsyncPriceFetcher,
+    ConstituentsFetcher,
+    TokenBucket,
+    parse_constituents_table,
+)
+
+START_DATE = dt.date(2025, 1, 6)
+END_DATE = dt.date(2025, 1, 8)
+
+
+def chart_response(symbol: str, timezone: str = "America/New_York") -> dict:
+    """Build a chart API response with bars for 2025-01-06 and 2025-01-07."""
+    timestamps = [
+        int(pd.Timestamp(f"2025-01-0{day} 09:30", tz=timezone).timestamp())
+        for day in (3, 6, 7)
+    ]
+    return {
+        "chart": {
+            "result": [
+                {
+                    "meta": {"symbol": symbol, "exchangeTimezoneName": timezone},
+                    "timestamp": timestamps,
+                    "indicators": {
+                        "quote": [
+                            {
+                                "open": [9.0, 10.0, 11.0],
+                                "high": [10.0, 12.0, 13.0],
+                                "low": [8.0, 9.0, 10.0],
+                                "close": [9.5, 11.0, 12.0],
+                                "volume": [900, 1000, 1100],
+                            }
+                        ],
+                        "adjclose": [{"adjclose": [4.75, 5.5, 6.0]}],
+                    },
+                }
+            ],
+            "error": None,
+        }
+    }
+
+
+def not_found_response() -> dict:
+    return {
+        "chart": {
+            "result": None,
+            "error": {"code": "Not Found", "description": "No data found"},
+        }
+    }
+
+
+def constituents_page(symbols: list[str]) -> bytes:
+    rows = "".join(
+        f"<tr><td>{symbol}</td><td>{symbol} Inc.</td></tr>" for symbol in symbols
+    )
+    return (
+        "<html><body>"
+        '<table class="infobox"><tr><th>Founded</th><td>1957</td></tr></table>'
+        '<table class="wikitable sortable" id="constituents">'
+        "<tr><th>Symbol</th><th>Security</th></tr>"
+        f"{rows}</table>"
+        "<table><tr><th>Date</th><th>Added</th></tr></table>"
+        "</body></html>"
+    ).encode()
+
+
+def request_symbol(request: httpx.Request) -> str:
+    return request.url.path.rsplit("/", 1)[-1]
+
+
+def make_fetcher(handler, **kwargs) -> AsyncPriceFetcher:
+    kwargs = {"rate": 1000, "backoff_seconds": 0, **kwargs}
+    return AsyncPriceFetcher(transport=httpx.MockTransport(handler), **kwargs)
+
+
+def test_fetch_returns_wide_adjusted_bars():
+    def handler(request):
+        return httpx.Response(200, json=chart_response(request_symbol(request)))
+
+    bars, errors = make_fetcher(handler).fetch(["AAPL", "MSFT"], START_DATE, END_DATE)
+
+    assert errors == {}
+    assert list(bars.columns.names) == ["Price", "Ticker"]
+    assert list(bars.columns.unique("Price")) == [
+        "Close",
+        "High",
+        "Low",
+        "Open",
+        "Volume",
+    ]
+    assert list(bars.index.date) == [dt.date(2025, 1, 6), dt.date(2025, 1, 7)]
+    # The index is tz-naive, like the yfinance daily downloads
+    assert bars.index.tz is None
+    # Prices are adjusted with the adjusted close, as with auto_adjust=True
+    assert bars[("Close", "AAPL")].tolist() == [5.5, 6.0]
+    assert bars[("Open", "AAPL")].tolist() == [5.0, 5.5]
+    assert bars[("Volume", "MSFT")].tolist() == [1000, 1100]
+
+
+def test_fetch_retries_throttled_requests():
+    attempts = {}
+
+    def handler(request):
+        symbol = request_symbol(request)
+        attempts[symbol] = attempts.get(symbol, 0) + 1
+        if attempts[symbol] < 3:
+            return httpx.Response(429)
+        return httpx.Response(200, json=chart_response(symbol))
+
+    bars, errors = make_fetcher(handler).fetch(["AAPL"], START_DATE, END_DATE)
+
+    assert errors == {}
+    assert attempts == {"AAPL": 3}
+    assert not bars.empty
+
+
+def test_fetch_isolates_failed_symbols():
+    def handler(request):
+        symbol = request_symbol(request)
+        if symbol == "INVALID":
+            return httpx.Response(404, json=not_found_response())
+        if symbol == "FLAKY":
+            raise httpx.ConnectError("Connection refused")
+        return httpx.Response(200, json=chart_response(symbol))
+
+    bars, errors = make_fetcher(handler, max_retries=1).fetch(
+        ["AAPL", "INVALID", "FLAKY"], START_DATE, END_DATE
+    )
+
+    assert sorted(errors) == ["FLAKY", "INVALID"]
+    assert list(bars.columns.unique("Ticker")) == ["AAPL"]
+
+
+def test_fetch_bounds_concurrent_requests():
+    in_flight, max_in_flight = 0, 0
+
+    async def handler(request):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json=chart_response(request_symbol(request)))
+
+    symbols = [f"T{i}" for i in range(10)]
+    make_fetcher(handler, max_concurrency=3).fetch(symbols, START_DATE, END_DATE)
+
+    assert max_in_flight == 3
+
+
+def test_token_bucket_limits_request_rate():
+    async def acquire(count: int) -> float:
+        bucket = TokenBucket(rate=20, capacity=1)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(count):
+            await bucket.acquire()
+        return loop.time() - start
+
+    # The first token is available straight away, the other 5 take 1/20s each
+    assert asyncio.run(acquire(6)) == pytest.approx(0.25, abs=0.05)
+
+
+def test_fetch_shares_rate_limit_across_threads():
+    def handler(request):
+        return httpx.Response(200, json=chart_response(request_symbol(request)))
+
+    fetcher = make_fetcher(handler, rate=10)
+    symbols = [f"T{i}" for i in range(10)]
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(
+            executor.map(lambda _: fetcher.fetch(symbols, START_DATE, END_DATE), [1, 2])
+        )
+    elapsed = time.monotonic() - start
+
+    assert all(errors == {} for _, errors in results)
+    # A full bucket covers the first 10 requests, the other 10 take 1/10s each
+    assert elapsed == pytest.approx(1.0, abs=0.3)
+
+
+def test_parse_constituents_table_only_parses_constituents_table():
+    table = parse_constituents_table(constituents_page(["AAPL", "MSFT"]))
+
+    assert table.columns.tolist() == ["Symbol", "Security"]
+    assert table["Symbol"].tolist() == ["AAPL", "MSFT"]
+
+
+def test_constituents_fetcher_fetches_pages_concurrently():
+    in_flight, max_in_flight = 0, 0
+
+    async def handler(request):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, content=constituents_page([request.url.path[1:]]))
+
+    fetcher = ConstituentsFetcher(transport=httpx.MockTransport(handler))
+    tables = fetcher.fetch([f"https://example.com/SP{i}" for i in (400, 500, 600)])
+
+    assert max_in_flight == 3
+    assert [table["Symbol"].tolist() for table in tables] == [
+        ["SP400"],
+        ["SP500"],
+        ["SP600"],
+    ]
+
+
+def test_constituents_fetcher_reuses_unmodified_pages(tmp_path):
+    url = "https://example.com/SP500"
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(
+            200, headers={"ETag": '"v1"'}, content=constituents_page(["AAPL"])
+        )
+
+    fetcher = ConstituentsFetcher(
+        cache=PageTableCache(tmp_path), transport=httpx.MockTransport(handler)
+    )
+    [table] = fetcher.fetch([url])
+    [cached_table] = fetcher.fetch([url])
+
+    assert "If-None-Match" not in requests[0].headers
+    assert requests[1].headers["If-None-Match"] == '"v1"'
+    pd.testing.assert_frame_equal(cached_table, table)
@@ -1,10 +1,11 @@
+import datetime as dt
 from pathlib import Path
 
 import pandas as pd
 import pandera.pandas as pa
 import pytest
 from deltalake import DeltaTable
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 
 from py_pipeline.config import (
     AWS_ACCESS_KEY,
@@ -17,7 +18,18 @@ from py_pipeline.config import (
     DB_PASSWORD,
     DB_NAME,
 )
-from py_pipeline.load import load_to_dw, load_to_s3
+from py_pipeline.extract import (
+    get_changes_from_s3,
+    get_prices_from_s3,
+    get_symbols_from_s3,
+)
+from py_pipeline.load import (
+    get_clustering_columns,
+    get_pipeline,
+    load_changes_to_dw,
+    load_to_dw,
+    load_to_s3,
+)
 
 TEST_DATA_DIR = Path(__file__).parent.joinpath("data")
 engine = create_engine(
@@ -63,8 +75,9 @@ def test_load_symbols_data_to_s3(asset_category, remove_s3_objects):
     assert_loaded_data_matches_expected(loaded_symbols, symbols)
 
 
+@pytest.mark.parametrize("loader", ("dlt", "copy"))
 @pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
-def test_load_symbols_data_to_dw(asset_category, drop_dw_tables):
+def test_load_symbols_data_to_dw(asset_category, loader, drop_dw_tables):
     symbols = (
         pd.read_parquet(
             TEST_DATA_DIR.joinpath(f"processed_{asset_category}_symbols.parquet")
@@ -75,7 +88,7 @@ def test_load_symbols_data_to_dw(asset_category, drop_dw_tables):
         .reset_index(drop=True)
     )
 
-    load_to_dw(symbols, "symbols", asset_category)
+    load_to_dw(symbols, "symbols", asset_category, loader)
 
     loaded_data = (
         pd.read_sql_table(f"symbols_{asset_category}", con=engine)
@@ -122,13 +135,14 @@ def test_update_symbols_data_on_s3(asset_category, remove_s3_objects):
     assert_loaded_data_matches_expected(loaded_symbols, expected_data)
 
 
+@pytest.mark.parametrize("loader", ("dlt", "copy"))
 @pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
-def test_update_symbols_data_on_dw(asset_category, drop_dw_tables):
+def test_update_symbols_data_on_dw(asset_category, loader, drop_dw_tables):
     # load historical data
     symbols = pd.read_parquet(
         TEST_DATA_DIR.joinpath(f"processed_{asset_category}_symbols.parquet")
     )
-    load_to_dw(symbols, "symbols", asset_category)
+    load_to_dw(symbols, "symbols", asset_category, loader)
 
     # Load updates
     if asset_category == "sp_stocks":
@@ -137,7 +151,7 @@ def test_update_symbols_data_on_dw(asset_category, drop_dw_tables):
         )
     else:
         symbols_update = symbols.copy()
-    load_to_dw(symbols_update, "symbols", asset_category)
+    load_to_dw(symbols_update, "symbols", asset_category, loader)
 
     # Verify
     expected_data = (
@@ -183,8 +197,126 @@ def test_load_price_data_to_s3(asset_category, remove_s3_objects):
     assert_loaded_data_matches_expected(loaded_price_df, price_df)
 
 
+@pytest.mark.parametrize("partition", ("year", "month"))
+def test_load_price_data_to_partitioned_s3_table(
+    monkeypatch, partition, remove_s3_objects
+):
+    monkeypatch.setenv("PRICE_HISTORY_PARTITION", partition)
+    price_df = pd.read_parquet(
+        TEST_DATA_DIR.joinpath("processed_sp_stocks_prices.parquet"),
+    )
+
+    load_to_s3(price_df, "price_history", "sp_stocks")
+
+    delta_table = DeltaTable(
+        f"{DATA_PATH}/price_history/sp_stocks", storage_options=storage_options
+    )
+    expected_partition_columns = ["year"] if partition == "year" else ["year", "month"]
+
+    assert delta_table.metadata().partition_columns == expected_partition_columns
+    assert_loaded_data_matches_expected(
+        delta_table.to_pandas().drop(columns=expected_partition_columns), price_df
+    )
+
+
+@pytest.fixture
+def local_data_path(monkeypatch, tmp_path):
+    monkeypatch.setenv("DATA_PATH", str(tmp_path))
+    get_pipeline.cache_clear()
+    yield tmp_path
+    get_pipeline.cache_clear()
+
+
+@pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
+def test_load_price_data_to_local_data_path(asset_category, local_data_path):
+    price_df = pd.read_parquet(
+        TEST_DATA_DIR.joinpath(f"processed_{asset_category}_prices.parquet"),
+    )
+
+    load_to_s3(price_df, "price_history", asset_category)
+    load_to_s3(price_df, "price_history", asset_category)
+
+    assert local_data_path.joinpath("price_history", asset_category).is_dir()
+    loaded_price_df = get_prices_from_s3(asset_category)
+    assert_loaded_data_matches_expected(loaded_price_df, price_df)
+
+
+@pytest.mark.parametrize("partition", ("year", "month"))
+def test_load_price_data_keeps_layout_of_existing_table(
+    monkeypatch, partition, local_data_path
+):
+    price_df = pd.read_parquet(
+        TEST_DATA_DIR.joinpath("processed_sp_stocks_prices.parquet"),
+    )
+    load_to_s3(price_df, "price_history", "sp_stocks")
+
+    monkeypatch.setenv("PRICE_HISTORY_PARTITION", partition)
+    load_to_s3(price_df, "price_history", "sp_stocks")
+
+    delta_table = DeltaTable(
+        str(local_data_path.joinpath("price_history", "sp_stocks"))
+    )
+    assert delta_table.metadata().partition_columns == []
+    assert sorted(get_prices_from_s3("sp_stocks").columns) == sorted(price_df.columns)
+
+
+@pytest.mark.parametrize(
+    ("start_date", "end_date"),
+    (
+        ("2000-01-05", "2000-02-14"),
+        ("2000-02-10", "2001-02-10"),
+        ("2000-12-01", "2001-01-05"),
+    ),
+)
+def test_get_prices_from_month_partitioned_table(
+    monkeypatch, start_date, end_date, local_data_path
+):
+    monkeypatch.setenv("PRICE_HISTORY_PARTITION", "month")
+    price_df = pd.read_parquet(
+        TEST_DATA_DIR.joinpath("processed_sp_stocks_prices.parquet"),
+    )
+    price_df = pd.concat(
+        price_df.assign(date_stamp=price_df["date_stamp"] + dt.timedelta(days=days))
+        for days in (0, 38, 336, 368)
+    ).reset_index(drop=True)
+
+    load_to_s3(price_df, "price_history", "sp_stocks")
+
+    loaded_price_df = get_prices_from_s3("sp_stocks", start_date, end_date)
+    dates = pd.to_datetime(price_df["date_stamp"])
+    expected_price_df = price_df[(dates >= start_date) & (dates <= end_date)]
+    assert_loaded_data_matches_expected(loaded_price_df, expected_price_df)
+    assert not loaded_price_df.empty
+
+
+def test_load_symbols_updates_symbols_universe(local_data_path):
+    symbols = pd.read_parquet(
+        TEST_DATA_DIR.joinpath("processed_sp_stocks_symbols.parquet")
+    )
+    latest_date_stamp = symbols["date_stamp"].max()
+    latest_symbols = symbols[symbols["date_stamp"] == latest_date_stamp]
+    removed_symbol = latest_symbols["symbol"].iloc[0]
+
+    load_to_s3(symbols, "symbols", "sp_stocks")
+    load_to_s3(
+        latest_symbols[latest_symbols["symbol"] != removed_symbol].assign(
+            date_stamp=latest_date_stamp + dt.timedelta(days=1)
+        ),
+        "symbols",
+        "sp_stocks",
+    )
+
+    universe = DeltaTable(
+        f"{local_data_path.as_uri()}/symbols_universe/sp_stocks"
+    ).to_pandas()
+    assert sorted(universe["symbol"]) == sorted(symbols["symbol"].unique())
+    assert sorted(get_symbols_from_s3("sp_stocks")) == sorted(universe["symbol"])
+    assert removed_symbol not in get_symbols_from_s3("sp_stocks", current=True)
+
+
+@pytest.mark.parametrize("loader", ("dlt", "copy"))
 @pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
-def test_load_price_data_to_dw(asset_category, drop_dw_tables):
+def test_load_price_data_to_dw(asset_category, loader, drop_dw_tables):
     price_df = (
         pd.read_parquet(
             TEST_DATA_DIR.joinpath(f"processed_{asset_category}_prices.parquet")
@@ -193,7 +325,7 @@ def test_load_price_data_to_dw(asset_category, drop_dw_tables):
         .reset_index(drop=True)
     )
 
-    load_to_dw(price_df, "price_history", asset_category)
+    load_to_dw(price_df, "price_history", asset_category, loader)
 
     loaded_data = (
         pd.read_sql_table(f"price_history_{asset_category}", con=engine)
@@ -204,6 +336,73 @@ def test_load_price_data_to_dw(asset_category, drop_dw_tables):
     assert_loaded_data_matches_expected(loaded_data, price_df)
 
 
+@pytest.mark.parametrize("partition", (None, "year"))
+@pytest.mark.parametrize("loader", ("dlt", "copy"))
+def test_load_price_data_to_dw_layout(monkeypatch, loader, partition, drop_dw_tables):
+    monkeypatch.setenv("DW_PRICE_HISTORY_PARTITION", partition or "")
+    price_df = pd.read_parquet(
+        TEST_DATA_DIR.joinpath("processed_sp_stocks_prices.parquet")
+    )
+
+    load_to_dw(price_df, "price_history", "sp_stocks", loader)
+    load_to_dw(price_df, "price_history", "sp_stocks", loader)
+
+    with engine.connect() as con:
+        index = con.execute(
+            text(
+                "SELECT indexdef FROM pg_indexes"
+                " WHERE indexname = 'price_history_sp_stocks_primary_key_idx'"
+            )
+        ).scalar_one()
+        partitioned = con.execute(
+            text(
+                "SELECT count(*) FROM pg_partitioned_table"
+                " WHERE partrelid = 'price_history_sp_stocks'::regclass"
+            )
+        ).scalar_one()
+    loaded_price_df = pd.read_sql_table("price_history_sp_stocks", con=engine)
+
+    assert index.startswith("CREATE UNIQUE INDEX")
+    assert index.endswith("(symbol, date_stamp)")
+    assert partitioned == (1 if partition else 0)
+    assert_loaded_data_matches_expected(loaded_price_df, price_df)
+
+
+@pytest.mark.parametrize("loader", ("dlt", "copy"))
+def test_load_price_data_to_dw_recreates_primary_key_index(loader, drop_dw_tables):
+    price_df = pd.read_parquet(
+        TEST_DATA_DIR.joinpath("processed_sp_stocks_prices.parquet")
+    )
+    load_to_dw(price_df, "price_history", "sp_stocks", loader)
+    with engine.begin() as con:
+        con.execute(text("DROP INDEX price_history_sp_stocks_primary_key_idx"))
+        con.execute(
+            text(
+                "CREATE UNIQUE INDEX price_history_sp_stocks_primary_key_idx"
+                " ON price_history_sp_stocks (date_stamp, symbol)"
+            )
+        )
+
+    load_to_dw(price_df, "price_history", "sp_stocks", loader)
+
+    with engine.connect() as con:
+        index = con.execute(
+            text(
+                "SELECT indexdef FROM pg_indexes"
+                " WHERE indexname = 'price_history_sp_stocks_primary_key_idx'"
+            )
+        ).scalar_one()
+    assert index.endswith("(symbol, date_stamp)")
+
+
+def test_get_clustering_columns():
+    assert get_clustering_columns(None) == []
+    assert get_clustering_columns('LINEAR(SYMBOL, "DATE_STAMP")') == [
+        "SYMBOL",
+        "DATE_STAMP",
+    ]
+
+
 @pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
 def test_update_price_on_s3(asset_category, remove_s3_objects):
     # Load historical price
@@ -232,13 +431,14 @@ def test_update_price_on_s3(asset_category, remove_s3_objects):
     assert_loaded_data_matches_expected(loaded_price_df, expected_df)
 
 
+@pytest.mark.parametrize("loader", ("dlt", "copy"))
 @pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
-def test_update_price_on_dw(asset_category, drop_dw_tables):
+def test_update_price_on_dw(asset_category, loader, drop_dw_tables):
     # Load historical price
     hist_price_df = pd.read_parquet(
         TEST_DATA_DIR.joinpath(f"processed_{asset_category}_prices.parquet")
     )
-    load_to_dw(hist_price_df, "price_history", asset_category)
+    load_to_dw(hist_price_df, "price_history", asset_category, loader)
 
     # Load price update with existing records
     price_update = pd.read_parquet(
@@ -247,7 +447,7 @@ def test_update_price_on_dw(asset_category, drop_dw_tables):
     price_update_with_existing = pd.concat(
         [hist_price_df, price_update], ignore_index=True
     )
-    load_to_dw(price_update_with_existing, "price_history", asset_category)
+    load_to_dw(price_update_with_existing, "price_history", asset_category, loader)
 
     # Verify merged data
     expected_df = (
@@ -265,5 +465,79 @@ def test_update_price_on_dw(asset_category, drop_dw_tables):
     assert_loaded_data_matches_expected(loaded_price_df, expected_df)
 
 
+def test_get_changes_from_s3(local_data_path):
+    price_df = pd.read_parquet(
+        TEST_DATA_DIR.joinpath("processed_sp_stocks_prices.parquet")
+    )
+    load_to_s3(price_df, "price_history", "sp_stocks")
+    primary_key = ["date_stamp", "symbol"]
+
+    changes, synced = get_changes_from_s3("sp_stocks", "price_history", primary_key)
+    assert changes.num_rows == len(price_df)
+
+    changes, unchanged = get_changes_from_s3(
+        "sp_stocks", "price_history", primary_key, synced
+    )
+    assert list(changes) == []
+    assert unchanged == synced
+
+    # Correct the oldest price twice and add the next day
+    correction = price_df[price_df["date_stamp"] == price_df["date_stamp"].min()]
+    correction = correction.head(1).assign(close=correction["close"].iloc[0] + 1)
+    load_to_s3(correction.assign(close=0.5), "price_history", "sp_stocks")
+    load_to_s3(correction, "price_history", "sp_stocks")
+    new_prices = price_df[price_df["date_stamp"] == price_df["date_stamp"].max()]
+    new_prices = new_prices.assign(
+        date_stamp=new_prices["date_stamp"] + dt.timedelta(days=1)
+    )
+    load_to_s3(new_prices, "price_history", "sp_stocks")
+
+    changes, _ = get_changes_from_s3("sp_stocks", "price_history", primary_key, synced)
+    changes = changes.to_pandas()
+    assert sorted(changes.columns) == sorted(price_df.columns)
+    assert len(changes) == len(new_prices) + 1
+    corrected = changes[changes["date_stamp"] == correction["date_stamp"].iloc[0]]
+    assert corrected["close"].tolist() == correction["close"].tolist()
+
+
+@pytest.mark.parametrize("loader", ("dlt", "copy"))
+def test_load_changes_to_dw(loader, local_data_path, drop_dw_tables):
+    hist_price_df = pd.read_parquet(
+        TEST_DATA_DIR.joinpath("processed_sp_stocks_prices.parquet")
+    )
+    load_to_s3(hist_price_df, "price_history", "sp_stocks")
+    load_changes_to_dw("price_history", "sp_stocks", loader=loader)
+
+    price_update = pd.read_parquet(
+        TEST_DATA_DIR.joinpath("processed_sp_stocks_prices_update.parquet")
+    )
+    correction = hist_price_df.head(1).assign(close=0.5)
+    load_to_s3(pd.concat([price_update, correction]), "price_history", "sp_stocks")
+    load_changes_to_dw("price_history", "sp_stocks", batch_rows=100, loader=loader)
+
+    expected_df = (
+        pd.concat([hist_price_df.iloc[1:], correction, price_update])
+        .sort_values(["date_stamp", "symbol"])
+        .reset_index(drop=True)
+    )
+    loaded_price_df = (
+        pd.read_sql_table("price_history_sp_stocks", con=engine)
+        .sort_values(["date_stamp", "symbol"])
+        .reset_index(drop=True)
+    )
+
+    assert_loaded_data_matches_expected(loaded_price_df, expected_df)
+    assert loaded_price_df["close"].tolist() == expected_df["close"].tolist()
+
+
+@pytest.mark.parametrize("destination", ("s3", "dw"))
+def test_get_pipeline_reuses_pipeline_per_dataset(destination):
+    pipeline = get_pipeline("price_history", "fx", destination)
+
+    assert get_pipeline("price_history", "fx", destination) is pipeline
+    assert get_pipeline("price_history", "sp_stocks", destination) is not pipeline
+    assert get_pipeline("symbols", "fx", destination) is not pipeline
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
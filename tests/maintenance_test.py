@@ -0,0 +1,71 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from deltalake import DeltaTable, write_deltalake
+
+from py_pipeline.config import (
+    AWS_ACCESS_KEY,
+    AWS_SECRET_KEY,
+    DATA_PATH,
+    S3_ENDPOINT,
+)
+from py_pipeline.maintenance import maintain_delta_table
+
+TEST_DATA_DIR = Path(__file__).parent.joinpath("data")
+
+storage_options = {
+    "AWS_ACCESS_KEY_ID": AWS_ACCESS_KEY,
+    "AWS_SECRET_ACCESS_KEY": AWS_SECRET_KEY,
+    "AWS_ENDPOINT_URL": S3_ENDPOINT,
+    "AWS_ALLOW_HTTP": "true",
+}
+
+
+@pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
+def test_maintain_delta_table_compacts_files(asset_category, remove_s3_objects):
+    price_df = pd.read_parquet(
+        TEST_DATA_DIR.joinpath(f"processed_{asset_category}_prices.parquet")
+    )
+    path = f"{DATA_PATH}/price_history/{asset_category}"
+    for _, daily_prices in price_df.groupby("date_stamp"):
+        write_deltalake(
+            path, daily_prices, mode="append", storage_options=storage_options
+        )
+
+    report = maintain_delta_table("price_history", asset_category)
+
+    assert report["files_before"] == price_df["date_stamp"].nunique()
+    assert report["files_after"] == 1
+    loaded_df = DeltaTable(path, storage_options=storage_options).to_pandas()
+    assert loaded_df.shape == price_df.shape
+
+
+def test_maintain_delta_table_zorders_partitions_with_small_files(
+    monkeypatch, tmp_path
+):
+    monkeypatch.setenv("DATA_PATH", str(tmp_path))
+    monkeypatch.setenv("PRICE_HISTORY_ZORDER", "true")
+    price_df = pd.read_parquet(
+        TEST_DATA_DIR.joinpath("processed_sp_stocks_prices.parquet")
+    )
+    path = str(tmp_path.joinpath("price_history", "sp_stocks"))
+    for year in (2000, 2000, 2001):
+        write_deltalake(
+            path, price_df.assign(year=year), mode="append", partition_by=["year"]
+        )
+
+    report = maintain_delta_table("price_history", "sp_stocks")
+
+    assert report["partitions_zordered"] == 1
+    assert report["files_after"] == 2
+    [optimize] = [
+        commit
+        for commit in DeltaTable(path).history()
+        if commit["operation"] == "OPTIMIZE"
+    ]
+    assert optimize["operationParameters"]["predicate"] == "[\"year = '2000'\"]"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
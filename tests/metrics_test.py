@@ -0,0 +1,108 @@
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from py_pipeline.metrics import (
+    format_metrics,
+    get_metrics,
+    get_peak_rss_mb,
+    measure,
+    metric_labels,
+    metrics_to_arrow,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    get_metrics(clear=True)
+    yield
+    get_metrics(clear=True)
+
+
+def test_measure_records_stage_with_labels():
+    df = pd.DataFrame({"symbol": ["AAPL", "MSFT"], "close": [1.0, 2.0]})
+
+    with metric_labels(asset_category="sp_stocks"):
+        with metric_labels(chunk="AAPL..MSFT"):
+            with measure("transform", dataset="price_history") as metrics:
+                metrics.record_size(df)
+
+    [record] = get_metrics()
+    assert record["stage"] == "transform"
+    assert record["status"] == "completed"
+    assert record["labels"] == {
+        "asset_category": "sp_stocks",
+        "chunk": "AAPL..MSFT",
+        "dataset": "price_history",
+    }
+    assert record["rows"] == 2
+    assert record["bytes"] == df.memory_usage(index=False).sum()
+    assert record["wall_seconds"] >= 0
+    assert record["peak_rss_increase_mb"] >= 0
+    assert record["process_peak_rss_mb"] > 0
+
+
+def test_measure_records_peak_memory_increase_of_stage():
+    with measure("transform"):
+        # Touch more memory than the process peak, so the stage raises it
+        data = b"x" * int((get_peak_rss_mb() + 64) * 1024**2)
+    del data
+    with measure("load"):
+        pass
+
+    transform, load = get_metrics()
+    assert transform["peak_rss_increase_mb"] >= 64
+    assert load["peak_rss_increase_mb"] == 0
+    assert load["process_peak_rss_mb"] == transform["process_peak_rss_mb"]
+
+
+def test_measure_records_failed_stage():
+    with pytest.raises(ValueError):
+        with measure("load"):
+            raise ValueError("Load failed")
+
+    assert [record["status"] for record in get_metrics()] == ["failed"]
+
+
+def test_measure_counts_streamed_batches():
+    batch = pa.record_batch({"close": [1.0, 2.0, 3.0]})
+
+    with measure("extract_load") as metrics:
+        consumed = list(metrics.count_batches(iter([batch, batch])))
+
+    assert len(consumed) == 2
+    [record] = get_metrics()
+    assert record["rows"] == 6
+    assert record["bytes"] == 2 * batch.nbytes
+
+
+def test_metrics_tables():
+    with metric_labels(chunk="AAPL..MSFT"):
+        with measure("extract", source="source"):
+            pass
+    records = get_metrics(clear=True)
+
+    [row] = format_metrics(records)
+    assert row["stage"] == "extract"
+    assert row["chunk"] == "AAPL..MSFT"
+    assert row["source"] == "source"
+
+    table = metrics_to_arrow(records)
+    assert table.num_rows == 1
+    assert table["labels"].to_pylist() == [
+        '{"chunk": "AAPL..MSFT", "source": "source"}'
+    ]
+    assert get_metrics() == []
+
+
+def test_get_metrics_by_labels():
+    for asset_category in ("fx", "sp_stocks"):
+        with measure("extract", asset_category=asset_category):
+            pass
+
+    [record] = get_metrics(clear=True, asset_category="fx")
+
+    assert record["labels"] == {"asset_category": "fx"}
+    assert [record["labels"] for record in get_metrics()] == [
+        {"asset_category": "sp_stocks"}
+    ]
@@ -1,10 +1,13 @@
+import datetime as dt
 from pathlib import Path
 
 import pandas as pd
 import pandera.pandas as pa
+import pyarrow
 import pytest
 
 from py_pipeline.transform import (
+    diff_symbols,
     transform_stocks_symbol_df,
     transform_fx_symbol_df,
     transform_price_df,
@@ -62,6 +65,29 @@ def test_transform_fx_symbol_df():
     pd.testing.assert_frame_equal(transformed_data, expected_transformed_data)
 
 
+def test_diff_symbols_ignores_date_stamp():
+    symbols_df = pd.read_csv(TEST_DATA_DIR.joinpath("raw_sp_stocks_symbols.csv"))
+    latest_df = transform_stocks_symbol_df(symbols_df, dt.date(2000, 1, 3))
+    # Snapshots read back from the lake have arrow backed columns and dlt columns
+    latest_df = pyarrow.Table.from_pandas(latest_df).to_pandas().assign(_dlt_id="id")
+
+    df = transform_stocks_symbol_df(symbols_df, dt.date(2000, 1, 4))
+
+    assert diff_symbols(df, latest_df) == {"added": 0, "removed": 0}
+    assert diff_symbols(df, None) == {"added": len(df), "removed": 0}
+
+
+def test_diff_symbols_counts_changed_rows():
+    symbols_df = pd.read_csv(TEST_DATA_DIR.joinpath("raw_sp_stocks_symbols.csv"))
+    latest_df = transform_stocks_symbol_df(symbols_df, dt.date(2000, 1, 3))
+
+    df = transform_stocks_symbol_df(symbols_df, dt.date(2000, 1, 4))
+    df.loc[0, "sector"] = "Changed"
+    df = df.iloc[:-1]
+
+    assert diff_symbols(df, latest_df) == {"added": 1, "removed": 2}
+
+
 @pytest.mark.parametrize("asset_category", ("fx", "sp_stocks"))
 def test_transform_price_df_returns_empty_df(asset_category):
     df = pd.DataFrame(columns=["Ticker", "Open", "High", "Low", "Close"])
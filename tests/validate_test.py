@@ -0,0 +1,58 @@
+from pathlib import Path
+
+import pandas as pd
+import pandera.pandas as pa
+import pytest
+
+from py_pipeline.validate import (
+    raw_price_schema,
+    transformed_price_schema,
+    validate_df,
+)
+
+TEST_DATA_DIR = Path(__file__).parent.joinpath("data")
+
+
+@pytest.fixture
+def raw_prices():
+    return pd.read_csv(
+        TEST_DATA_DIR.joinpath("raw_sp_stocks_prices.csv"),
+        header=[0, 1],
+        index_col=[0],
+        parse_dates=True,
+    )
+
+
+def test_validate_df_sample_matches_full_validation(raw_prices):
+    full = validate_df(raw_prices, raw_price_schema, "full")
+    sample = validate_df(raw_prices, raw_price_schema, "sample")
+
+    pd.testing.assert_frame_equal(sample, full)
+
+
+def test_validate_df_sample_raises_schema_error(raw_prices):
+    raw_prices.columns.names = ["Symbol", "Price"]
+
+    with pytest.raises(pa.errors.SchemaErrors):
+        validate_df(raw_prices, raw_price_schema, "sample")
+
+
+def test_validate_df_sample_checks_rows_outside_the_sample(monkeypatch):
+    monkeypatch.setattr("py_pipeline.validate.VALIDATION_SAMPLE_ROWS", 1)
+    prices = pd.read_parquet(
+        TEST_DATA_DIR.joinpath("processed_sp_stocks_prices.parquet")
+    )
+    prices["volume"] = prices["volume"].astype("Int64")
+    prices.loc[prices.index[-1], "symbol"] = None
+
+    with pytest.raises(pa.errors.SchemaError):
+        validate_df(prices, transformed_price_schema, "sample")
+
+
+def test_validate_df_skip_returns_input(raw_prices):
+    assert validate_df(raw_prices, raw_price_schema, "skip") is raw_prices
+
+
+def test_validate_df_raises_error_for_unknown_mode(raw_prices):
+    with pytest.raises(ValueError, match="Unknown validation mode"):
+        validate_df(raw_prices, raw_price_schema, "partial")